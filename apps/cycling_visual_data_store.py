@@ -0,0 +1,302 @@
+"""
+Single store of the processed data tables for all of the visuals.
+
+Each table is read from disk once, the first time a visual asks for it, from
+the columnar file if there is one (see cycling_helper_functions.table_path)
+otherwise the CSV, and its columns are given their proper types (dates,
+times of day, categories).  The parts of the dates and times the visuals
+filter and group on (year, month, day of the week, minute of the day) are
+also worked out once here, so callbacks don't need to, as are small cubes of
+crash counts broken down by what each visual filters or groups crashes by.
+Every visual is then handed a view of the same data rather than its own copy.
+
+The store's version changes whenever it is cleared, which happens when
+refresh finds a table's file has changed since it was read, so anything
+built from the tables (eg. the figure cache) knows to drop what it has.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cycling_globals import DATA_FOLDER
+from cycling_helper_functions import *
+
+######################################################################
+#                     PROCESSED TABLE COLUMN TYPES                   #
+######################################################################
+
+#   Columns holding dates or date times
+DATE_COLUMNS = ['date', 'date_time', 'date_time_x', 'date_time_y']
+
+#   Columns holding times of day, as time since midnight
+TIME_COLUMNS = ['time', 'sunset', 'sunrise']
+
+#   Columns holding a small set of repeated text values. severity is left as text as its order of appearance sets
+#   the colours of the severity visuals, which grouping on a category can change
+CATEGORY_COLUMNS = ['suburb', 'district', 'lighting', 'closest weather station', 'product_code', 'quality']
+
+#   Values written for a missing category, read as missing like they are from CSV
+MISSING_CATEGORIES = ['', 'NA']
+
+#   Days of the week, in the order of the day of week column categories
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+#   Crash count cubes, by name, and the crash table columns each is broken down by. each is kept to what one visual
+#   needs, so its size depends on the number of suburbs, years, etc. rather than the number of crashes
+CRASH_CUBES = {
+    'location': ['suburb', 'district', 'year', 'severity'],
+    'rainfall': ['rainfall_category', 'severity'],
+    'month': ['month', 'dark'],
+    'lights': ['number_of_lights', 'severity', 'dark'],
+    'time': ['day_of_week', 'time_bucket']
+}
+
+
+######################################################################
+#                        DERIVED DATA FUNCTIONS                      #
+######################################################################
+
+def rainfall_categories(rainfall):
+    """
+    :param rainfall: daily rainfall amounts in mm
+    :return: the rainfall category of each amount, none, light, moderate, heavy or violent, split by the quartiles of
+    the days with rain
+    """
+    #   Getting the rainfall condition information
+    temp_rainfall = rainfall[rainfall != 0]
+    q75, q25 = np.percentile(temp_rainfall, [75, 25])
+    median = np.median(temp_rainfall)
+
+    #   Creating dictionary of rainfall conditions
+    rainfall_category_conditions = {
+        'none':
+            (rainfall <= 0),
+        'light':
+            (rainfall <= q25) &
+            (rainfall > 0),
+        'moderate':
+            (rainfall > q25) &
+            (rainfall <= median),
+        'heavy':
+            (rainfall > median) &
+            (rainfall <= q75),
+        'violent':
+            (rainfall > q75)
+    }
+
+    return np.select(
+        rainfall_category_conditions.values(),
+        rainfall_category_conditions.keys(),
+        default='none'
+    )
+
+
+def time_of_day_buckets(minutes):
+    """
+    :param minutes: minutes since midnight
+    :return: a minute standing in for each minute's bucket. the buckets split each quarter hour into the minute on the
+    quarter hour and the minutes either side of its halfway point, so rounding a bucket's minute to the nearest 15, 30,
+    60, 120 or 240 minutes gives the same time as rounding any minute in the bucket
+    """
+    quarter_hour = minutes // 15 * 15
+    minute = minutes - quarter_hour
+
+    return quarter_hour + np.select([minute == 0, minute <= 7], [0, 4], default=11)
+
+
+def crash_count_cube(crashes, dimensions):
+    """
+    :param crashes: crash table from the data store
+    :param dimensions: columns to break the crashes down by, see CRASH_CUBES, where 'rainfall_category' and
+    'time_bucket' are worked out from the rainfall amount and time of each crash
+    :return: crash count cube, a row for each combination of the dimensions found in the crashes with the number of
+    'crashes' and total 'cyclists', so callbacks can filter and group it instead of the whole crash table
+    """
+    derived_columns = {
+        'rainfall_category': lambda: rainfall_categories(crashes['rainfall_amount_(millimetres)']),
+        'time_bucket': lambda: time_of_day_buckets(crashes['minute_of_day'])
+    }
+
+    keys = list()
+    for column in dimensions:
+        values = pd.Series(derived_columns[column](), index=crashes.index, name=column) \
+            if column in derived_columns else crashes[column]
+
+        #   Categories are grouped by their codes, so missing values are kept and only combinations found are counted
+        keys.append(values.cat.codes.rename(column) if isinstance(values.dtype, pd.CategoricalDtype) else values)
+
+    cube = crashes.groupby(keys, dropna=False).agg(crashes=('cyclists', 'size'), cyclists=('cyclists', 'sum'))
+    cube = cube.reset_index()
+
+    for column in dimensions:
+        if column in crashes.columns and isinstance(crashes[column].dtype, pd.CategoricalDtype):
+            cube[column] = pd.Categorical.from_codes(cube[column], dtype=crashes[column].dtype)
+
+    return cube
+
+
+######################################################################
+#                          DATA STORE CLASS                          #
+######################################################################
+
+class VisualDataStore:
+    """
+    Loads each processed table once, with typed columns, and hands out views of it. it is safe to use from the
+    threads of the Dash server
+    """
+
+    def __init__(self, folder=DATA_FOLDER):
+        """
+        :param folder: folder the processed tables are written to
+        """
+        self.folder = folder
+        self.version = 0
+        self.__tables = dict()
+        self.__modified = dict()
+        self.__crash_cubes = dict()
+        self.__lock = threading.Lock()
+
+    def __table_file(self, table_name):
+        """
+        :param table_name: name of the processed table, eg. 'crashes'
+        :return: path of the table's columnar file if there is one, otherwise its CSV
+        """
+        path = table_path(self.folder, table_name)
+
+        if not file_exists(path):
+            path = table_path(self.folder, table_name, columnar=False)
+
+        return path
+
+    @staticmethod
+    def __modified_time(path):
+        """
+        :param path: path of a table file
+        :return: the time the file was last modified, or None if it doesn't exist
+        """
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def __read_table(self, table_name):
+        """
+        :param table_name: name of the processed table, eg. 'crashes'
+        :return: the table read from its columnar file if there is one, otherwise from CSV
+        """
+        path = self.__table_file(table_name)
+        self.__modified[table_name] = (path, self.__modified_time(path))
+
+        return read_table_to_df(path)
+
+    @staticmethod
+    def __set_types(df):
+        """
+        :param df: processed table
+        :return: the table with its date, time of day and category columns typed (already the case from Feather)
+        """
+        for column in df.columns.intersection(DATE_COLUMNS):
+            df[column] = pd.to_datetime(df[column])
+
+        for column in df.columns.intersection(TIME_COLUMNS):
+            if not pd.api.types.is_timedelta64_dtype(df[column]):
+                df[column] = pd.to_timedelta(df[column])
+
+        for column in df.columns.intersection(CATEGORY_COLUMNS):
+            categories = df[column].astype('category')
+            df[column] = categories.cat.remove_categories(categories.cat.categories.intersection(MISSING_CATEGORIES))
+
+        return df
+
+    @staticmethod
+    def __compact_integers(values):
+        """
+        :param values: whole numbers that fit in 16 bits, or missing
+        :return: the numbers as int16, or float32 if any are missing
+        """
+        return values.astype('float32' if values.isna().any() else 'int16')
+
+    @staticmethod
+    def __add_date_time_parts(df):
+        """
+        :param df: processed table with typed columns
+        :return: the table with the parts of its 'date' and 'time' the visuals filter and group on worked out once:
+        'year', 'month' (1 - 12), 'day_of_week' (category of DAY_NAMES) and 'minute_of_day' (0 - 1439)
+        """
+        if 'date' in df.columns:
+            df['year'] = VisualDataStore.__compact_integers(df['date'].dt.year)
+            df['month'] = VisualDataStore.__compact_integers(df['date'].dt.month)
+            df['day_of_week'] = pd.Categorical(df['date'].dt.day_name(), categories=DAY_NAMES)
+
+        if 'time' in df.columns:
+            df['minute_of_day'] = VisualDataStore.__compact_integers(df['time'].dt.total_seconds() // 60)
+
+        return df
+
+    def __get_table(self, table_name):
+        """
+        :param table_name: name of the processed table, eg. 'crashes'
+        :return: the loaded table, loading it if it isn't yet (the lock must be held)
+        """
+        if table_name not in self.__tables:
+            self.__tables[table_name] = self.__add_date_time_parts(self.__set_types(self.__read_table(table_name)))
+
+        return self.__tables[table_name]
+
+    def __clear(self):
+        """
+        Drops the loaded tables and cubes and moves the store on to a new version (the lock must be held)
+        """
+        self.__tables.clear()
+        self.__modified.clear()
+        self.__crash_cubes.clear()
+        self.version += 1
+
+    def get(self, table_name):
+        """
+        :param table_name: name of the processed table, eg. 'crashes'
+        :return: a view of the table, sharing its data with every other view, so it mustn't be changed in place
+        (adding or replacing whole columns on the view is fine)
+        """
+        with self.__lock:
+            return self.__get_table(table_name).copy(deep=False)
+
+    def get_crash_cube(self, cube_name):
+        """
+        :param cube_name: name of the crash count cube, a key of CRASH_CUBES
+        :return: a view of the crash count cube (see crash_count_cube), built once from the crash table
+        """
+        with self.__lock:
+            if cube_name not in self.__crash_cubes:
+                self.__crash_cubes[cube_name] = crash_count_cube(self.__get_table('crashes'), CRASH_CUBES[cube_name])
+
+            return self.__crash_cubes[cube_name].copy(deep=False)
+
+    def refresh(self):
+        """
+        Clears the store if the file of any loaded table has been rewritten (or replaced) since it was read
+        :return: the store's version
+        """
+        with self.__lock:
+            for table_name, modified in self.__modified.items():
+                path = self.__table_file(table_name)
+                if (path, self.__modified_time(path)) != modified:
+                    self.__clear()
+                    break
+
+            return self.version
+
+    def clear(self):
+        """
+        Drops the loaded tables and cubes, so they're read from disk again when next asked for, and moves the store on
+        to a new version
+        """
+        with self.__lock:
+            self.__clear()
+
+
+#   The store shared by all of the visuals
+data_store = VisualDataStore()
@@ -0,0 +1,135 @@
+"""
+Cache of the figures the visuals' callbacks return.
+
+Most callbacks are called again and again with the same inputs (the default
+year, granularity and checklists), so what each returns is kept, keyed on its
+input values, and handed back on a repeat call rather than building and
+validating the figures again.  The cache has a memory budget, taken as the
+JSON size of the cached outputs, and drops the least recently used outputs to
+stay within it.  Everything cached is dropped when the data store moves on to
+a new version, ie. when the processed data changes.
+"""
+
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+
+from cycling_globals import FIGURE_CACHE_SIZE
+from apps.cycling_visual_data_store import data_store
+
+######################################################################
+#                          FIGURE CACHE CLASS                        #
+######################################################################
+
+
+class FigureCache:
+    """
+    Least recently used cache of callback outputs, with a memory budget. it is safe to use from the threads of the
+    Dash server
+    """
+
+    def __init__(self, max_size=FIGURE_CACHE_SIZE, store=data_store):
+        """
+        :param max_size: memory budget in bytes, 0 turns the cache off
+        :param store: data store the cached figures are built from
+        """
+        self.max_size = max_size
+        self.store = store
+        self.__version = store.version
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __entries_size(self):
+        """
+        :return: total size in bytes of the cached outputs (the lock must be held)
+        """
+        return sum(size for outputs, size in self.__entries.values())
+
+    @property
+    def size(self):
+        """
+        :return: total size in bytes of the cached outputs
+        """
+        with self.__lock:
+            return self.__entries_size()
+
+    def get(self, key):
+        """
+        Empties the cache first if the data store's tables have changed since the figures were cached
+        :param key: callback name and input values
+        :return: the cached outputs, or None if they aren't cached
+        """
+        version = self.store.refresh()
+
+        with self.__lock:
+            if version != self.__version:
+                self.__entries.clear()
+                self.__version = version
+
+            if key not in self.__entries:
+                return None
+
+            self.__entries.move_to_end(key)
+
+            return self.__entries[key][0]
+
+    def put(self, key, outputs, version):
+        """
+        :param key: callback name and input values
+        :param outputs: what the callback returned for the inputs
+        :param version: version of the data store the outputs were built from, outputs built from an out of date
+        version aren't cached
+        """
+        if not self.max_size:
+            return
+
+        size = len(to_json_plotly(outputs))
+
+        if size > self.max_size:
+            return
+
+        with self.__lock:
+            if version != self.__version:
+                return
+
+            self.__entries.pop(key, None)
+            self.__entries[key] = (outputs, size)
+
+            #   DROPPING THE LEAST RECENTLY USED OUTPUTS UNTIL WITHIN BUDGET
+            total_size = self.__entries_size()
+            while total_size > self.max_size:
+                total_size -= self.__entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        """
+        Drops everything cached
+        """
+        with self.__lock:
+            self.__entries.clear()
+
+
+#   The cache shared by all of the visuals' callbacks
+figure_cache = FigureCache()
+
+
+def cache_figures(callback):
+    """
+    :param callback: Dash callback function, which mustn't change its inputs or anything it returns
+    :return: the callback, returning its cached outputs when called again with the same input values
+    """
+    @functools.wraps(callback)
+    def cached_callback(*args):
+        key = (callback.__module__, callback.__name__, json.dumps(args, sort_keys=True, default=str))
+
+        outputs = figure_cache.get(key)
+        if outputs is None:
+            version = figure_cache.store.version
+            outputs = callback(*args)
+            figure_cache.put(key, outputs, version)
+
+        return outputs
+
+    return cached_callback
@@ -18,9 +18,6 @@ from apps.cycling_visual_global_functions import *
 #   Getting Custom Colors
 colors_list = get_colors()
 
-#   Getting Required Data
-df_crashes = get_data_for_vis(0)
-
 ######################################################################
 #                          SETTING UP HTML                           #
 ######################################################################
@@ -105,13 +102,12 @@ def crashes_by_time_of_day_and_location(data_set, time_filter_vals):
     :return: map scatter plot with crashes between user selected times
     """
     vis_df = data_set.copy()
-    vis_df = vis_df.set_axis(pd.to_datetime(vis_df['time']), axis='index')
     #   Making the user input time strings
     start_time = str(time_filter_vals[0]).zfill(2) + ':00'
     finish_time = str(time_filter_vals[1]).zfill(2) + ':59'
     #   Getting rows where time is between user selected inputs
-    vis_df = vis_df.between_time(start_time, finish_time)
-    vis_df = vis_df.groupby(['suburb', 'lat', 'long'], as_index=False).agg({'cyclists': sum})
+    vis_df = vis_df[vis_df['minute_of_day'].between(time_filter_vals[0] * 60, time_filter_vals[1] * 60 + 59)]
+    vis_df = vis_df.groupby(['suburb', 'lat', 'long'], as_index=False, observed=True).agg({'cyclists': sum})
 
     fig = px.scatter_mapbox(
         vis_df,
@@ -135,7 +131,7 @@ def crashes_by_day_of_week(data_set):
     """
     vis_df = data_set.copy()
 
-    vis_df = vis_df.groupby(['day_of_week'], as_index=False).agg({'cyclists': sum})
+    vis_df = vis_df.groupby(['day_of_week'], as_index=False, observed=True).agg({'cyclists': sum})
 
     fig = px.bar(
         vis_df,
@@ -160,13 +156,14 @@ def crashes_by_day_of_week(data_set):
 
 def crashes_by_time_of_day(data_set, tod_nearest_minute):
     """
-    :param tod_nearest_minute: The user selected time grouping
+    :param tod_nearest_minute: The user selected time grouping, 15, 30, 60, 120 or 240 minutes
     :return: A bar graph showing the crashes by user selected time grouping
     """
     vis_df = data_set.copy()
 
-    #   Rounding time based on user input
-    vis_df['time'] = pd.to_datetime(vis_df['time']).round(str(tod_nearest_minute) + 'T').dt.time
+    #   Rounding time based on user input, the cube's time buckets round the same as the times in them
+    vis_df['time'] = minute_of_day_as_time(
+        (vis_df['time_bucket'] / tod_nearest_minute).round() * tod_nearest_minute)
 
     vis_df = vis_df.groupby(['time'], as_index=False).agg({'cyclists': sum})
 
@@ -200,6 +197,7 @@ def crashes_by_time_of_day(data_set, tod_nearest_minute):
         Input(component_id='selected_time_of_day', component_property='value')
     ]
 )
+@cache_figures
 def crashes_by_time_visual(tod_nearest_minute, selected_dow, selected_tod):
     """
     :param tod_nearest_minute: the selected time grouping
@@ -207,15 +205,16 @@ def crashes_by_time_visual(tod_nearest_minute, selected_dow, selected_tod):
     :param selected_tod: the selected time of day
     :return: crashes by location vis, crashes by day vis, crashes by time vis
     """
-    vis_df = df_crashes[['district', 'suburb', 'date', 'time', 'cyclists', 'lat', 'long']].copy()
-
-    vis_df['day_of_week'] = pd.to_datetime(vis_df['date']).dt.day_name()
-
+    #   Getting Required Data, the crash locations for the map and the crash count cube for the day and time charts
+    vis_df = get_data_for_vis(0)[['district', 'suburb', 'day_of_week', 'minute_of_day', 'cyclists', 'lat', 'long']]
     vis_df = vis_df[vis_df['day_of_week'].isin(selected_dow)]
 
-    fig_crashes_by_hour = crashes_by_time_of_day(vis_df, tod_nearest_minute)
+    cube_df = get_crash_cube('time')
+    cube_df = cube_df[cube_df['day_of_week'].isin(selected_dow)]
+
+    fig_crashes_by_hour = crashes_by_time_of_day(cube_df, tod_nearest_minute)
 
-    fig_crashes_by_day_of_week = crashes_by_day_of_week(vis_df)
+    fig_crashes_by_day_of_week = crashes_by_day_of_week(cube_df)
 
     fig_crashes_by_time_and_location = crashes_by_time_of_day_and_location(vis_df, selected_tod)
 
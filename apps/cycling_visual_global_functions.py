@@ -5,6 +5,8 @@
 
 import os
 import pandas as pd
+from apps.cycling_visual_data_store import data_store, rainfall_categories
+from apps.cycling_visual_figure_cache import cache_figures
 
 ######################################################################
 #              RETRIEVING DATASET FROM CYCLING MAIN                  #
@@ -14,19 +16,53 @@ import pandas as pd
 def get_data_for_vis(return_both):
     """
     :param return_both: Are both cyclist and crashes data required for the vis 0 = no, 1 = yes
-    :return: the dataset(s) required
+    :return: the dataset(s) required, as views of the tables in the shared data store
     """
-    crashes_raw_data = pd.read_csv('data/crashes.csv')
-    cyclist_raw_data = pd.read_csv('data/cyclists.csv')
+    crashes_raw_data = data_store.get('crashes')
+    cyclist_raw_data = data_store.get('cyclists')
 
     if return_both == 1:
         return crashes_raw_data, cyclist_raw_data
     else:
         return crashes_raw_data
 
+
+def get_crash_cube(cube_name):
+    """
+    :param cube_name: which crash count cube, eg. 'location' for crashes by suburb, district, year and severity
+    :return: the crash count cube, the number of crashes and cyclists for each combination of its columns
+    """
+    return data_store.get_crash_cube(cube_name)
+
 ######################################################################
 #                   GLOBAL FUNCTIONS FOR VISUALS                     #
 ######################################################################
+def minute_of_day_as_time(minutes):
+    """
+    :param minutes: minutes since midnight, wrapping round past the end of the day
+    :return: the minutes as times of day (datetime.time), eg. for axis labels
+    """
+    return (pd.Timestamp(0) + pd.to_timedelta(minutes % (24 * 60), unit='m')).dt.time
+
+
+def fill_missing_categories(data_set, column, categories, fill_value=0):
+    """
+    :param data_set: aggregated data, one row for each value of column
+    :param column: column the data was grouped by, eg. 'suburb'
+    :param categories: every value the visual shows, in order, eg. all suburbs on the map
+    :param fill_value: value for the other columns of the rows added for missing categories
+    :return: the data with a row for each category, in order, then any rows for values not in categories
+    """
+    if isinstance(data_set[column].dtype, pd.CategoricalDtype):
+        data_set = data_set.astype({column: object})
+
+    vis_df = data_set.set_index(column)
+    categories = pd.Index(categories)
+    vis_df = vis_df.reindex(categories.append(vis_df.index.difference(categories)), fill_value=fill_value)
+
+    return vis_df.rename_axis(column).reset_index()
+
+
 def get_colors():
     """
     :return: A colour list for use in the visuals
@@ -38,6 +38,7 @@ with open('data/geo/features.json') as geojson_filename:
             })
             geo_district_names.append(row['properties'].get('act_loca_2').title())
     geo_district_shapes = {'type': 'FeatureCollection', 'features': geo_district_shapes_temp}
+    geo_district_categories = pd.CategoricalIndex(geo_district_names)
     geo_district_name_filters = geo_district_names
     geo_district_name_filters.insert(0, 'All')
     ######################################################################
@@ -55,16 +56,10 @@ with open('data/geo/features.json') as geojson_filename:
             })
             geo_suburb_names.append(row.get('properties').get('act_loca_2').title())
     geo_suburb_shapes = {'type': 'FeatureCollection', 'features': geo_suburb_shapes_temp}
+    geo_suburb_categories = pd.CategoricalIndex(geo_suburb_names)
     geo_suburb_names.insert(0, 'All')
 geojson_filename.close()
 
-######################################################################
-#                        RETRIEVING TEMP DATA                        #
-######################################################################
-
-crashes_df = get_data_for_vis(0)
-
-
 ######################################################################
 #                          SETTING UP HTML                           #
 ######################################################################
@@ -185,6 +180,7 @@ var_dashboard = html.Div(
         Input(component_id='selected_map_granularity', component_property='value')
     ]
 )
+@cache_figures
 def map_crashes_by_suburb_and_date(selected_year, selected_map_granularity):
     """
     :param selected_year: year selected by a user via slider component
@@ -197,31 +193,31 @@ def map_crashes_by_suburb_and_date(selected_year, selected_map_granularity):
     if selected_map_granularity == 'Districts':
         var_geojson = geo_district_shapes
         var_location = 'district'
-        var_all_locations_list = geo_district_names
+        var_all_locations = geo_district_categories
         var_zoom = 8.25
         var_center = {'lat': -35.51405, 'lon': 149.07130}
     elif selected_map_granularity == 'Suburbs':
         var_geojson = geo_suburb_shapes
         var_location = 'suburb'
-        var_all_locations_list = geo_suburb_names
+        var_all_locations = geo_suburb_categories
         var_zoom = 9.25
         var_center = {'lat': -35.3222, 'lon': 149.1287}
 
+    #   Only cyclist counts by location and year are needed, so the crash count cube is used
+    crashes_df = get_crash_cube('location')
+
     #   2021 = ALL YEARS
     if selected_year == 2021:
-        selected_year_crash_data = crashes_df[['date', var_location, 'cyclists']]
+        selected_year_crash_data = crashes_df[[var_location, 'cyclists']]
     else:
-        selected_year_crash_data = crashes_df.loc[
-            pd.to_datetime(crashes_df['date']).dt.year == selected_year, [var_location, 'cyclists']]
+        selected_year_crash_data = crashes_df.loc[crashes_df['year'] == selected_year, [var_location, 'cyclists']]
 
     selected_year_crash_data_df = selected_year_crash_data.groupby(
-        [var_location], as_index=False).agg({'cyclists': sum})
+        [var_location], as_index=False, observed=True).agg({'cyclists': sum})
 
     #   IF ANY LOCATION HAS NO DATA LOCATION WILL = 0
-    for i in var_all_locations_list:
-        if selected_year_crash_data_df[selected_year_crash_data_df[var_location] == i].empty:
-            selected_year_crash_data_df = selected_year_crash_data_df.append(
-                {var_location: i, 'cyclists': 0}, ignore_index=True)
+    selected_year_crash_data_df = fill_missing_categories(
+        selected_year_crash_data_df, var_location, var_all_locations)
 
     sum(selected_year_crash_data_df['cyclists'])
     max_colour = max(selected_year_crash_data_df['cyclists'])
@@ -271,9 +267,11 @@ def map_crashes_by_suburb_and_date(selected_year, selected_map_granularity):
     return fig, var_total_crash_count
 
 
-def crashes_count_by_location_and_year(data_set, location):
+def crashes_count_by_location_and_year(data_set, location, years):
     vis_df = data_set.drop(columns=['severity'])
     vis_df = vis_df.groupby(['year'], as_index=False).agg({'cyclists': sum})
+    #   YEARS WITHOUT CRASHES AT THE LOCATION = 0 RATHER THAN BEING SKIPPED BY THE LINE
+    vis_df = fill_missing_categories(vis_df, 'year', years)
 
     fig = px.line(
         vis_df,
@@ -328,6 +326,7 @@ def crash_severity_by_location_and_year(data_set, location):
         Input(component_id='location_filter', component_property='value')
     ]
 )
+@cache_figures
 def location_crash_count_visuals(selected_map_granularity, location_filter_value):
     """
     :param selected_map_granularity: Does the map show districts or suburbs?
@@ -345,14 +344,10 @@ def location_crash_count_visuals(selected_map_granularity, location_filter_value
     #   GETTING REQUIRED DATA   #
     #############################
 
-    vis_df = crashes_df
+    vis_df = get_crash_cube('location')
+    crash_years = sorted(vis_df['year'].dropna().unique())
     #   SELECTING COLUMNS
-    vis_df = vis_df[[location_type, 'cyclists', 'severity', 'date']]
-    #   ADDING YEAR COLUMN
-    vis_df_year = vis_df.copy()
-    vis_df_year['year'] = pd.DatetimeIndex(vis_df['date']).year
-    #   DROPPING DATE COLUMN
-    vis_df_year = vis_df_year.drop(columns=['date'])
+    vis_df_year = vis_df[[location_type, 'cyclists', 'severity', 'year']]
     #   FILTERING LOCATION
     if location_filter_value != 'All':
         vis_df_year = vis_df_year.loc[vis_df_year[location_type] == location_filter_value]
@@ -367,7 +362,7 @@ def location_crash_count_visuals(selected_map_granularity, location_filter_value
         location = location_filter_value
 
     #   CREATING THE VISUALS
-    fig_crash_count = crashes_count_by_location_and_year(vis_df_year, location)
+    fig_crash_count = crashes_count_by_location_and_year(vis_df_year, location, crash_years)
     fig_crash_severity = crash_severity_by_location_and_year(vis_df_year, location)
 
     return fig_crash_count, fig_crash_severity
@@ -2,6 +2,7 @@
 @author:  Hugh Porter
 @uid:     u7398670
 """
+import calendar
 import pandas as pd
 import numpy as np
 
@@ -16,10 +17,6 @@ from apps.cycling_visual_global_functions import *
 
 # Getting Colours for use in visual
 colors_list = get_colors()
-#   Getting Dataset required for vis.
-df_crashes = get_data_for_vis(0)
-#   Creating a copy of the dataset
-df_crash_data = df_crashes.copy()
 
 ######################################################################
 #                          SETTING UP HTML                           #
@@ -74,9 +71,10 @@ def crashes_by_month(data_set):
     #   Making a copy of the data set
     vis_df = data_set.copy()
     vis_df = vis_df[vis_df['dark'] == 1]
-    vis_df['month'] = pd.to_datetime(vis_df['date']).dt.month_name()
 
     vis_df = vis_df.groupby(['month'], as_index=False).agg({'cyclists': sum})
+    vis_df = fill_missing_categories(vis_df, 'month', range(1, 13))
+    vis_df['month'] = vis_df['month'].map(dict(enumerate(calendar.month_name)))
 
     fig = px.bar(
         vis_df,
@@ -156,10 +154,10 @@ def crashes_by_street_lights(data_set, show_severity):
         Input(component_id='bool_show_severity', component_property='value')
     ]
 )
+@cache_figures
 def crashes_by_lighting_visuals(show_severity):
-    vis_df = df_crash_data[['number_of_lights', 'sunset', 'date', 'time', 'cyclists', 'dark', 'severity']]
-
-    fig_crashes_by_month = crashes_by_month(vis_df)
-    fig_crashes_by_street_lighting = crashes_by_street_lights(vis_df, show_severity)
+    #   Getting Datasets required for vis, the crash count cubes as only cyclist counts are shown
+    fig_crashes_by_month = crashes_by_month(get_crash_cube('month'))
+    fig_crashes_by_street_lighting = crashes_by_street_lights(get_crash_cube('lights'), show_severity)
 
     return fig_crashes_by_month, fig_crashes_by_street_lighting
@@ -22,86 +22,35 @@ colors_list = get_colors()
 
 """
     DATASET 1: Crash Count
-    Columns = cyclists, rainfall, severity
+    Columns = cyclists, rainfall_category, severity, ...
+    Crash counts by rainfall category come from the shared crash count cube (get_crash_cube('rainfall'))
 """
-df_crashes, df_cyclists = get_data_for_vis(1)
-
-df_crash_count_data = df_crashes.copy()
-
-df_crash_count_data = df_crash_count_data[
-    ['cyclists', 'rainfall_amount_(millimetres)', 'severity']]
-
-#   Getting the rainfall condition information
-temp_df_rainfall = df_crash_count_data[df_crash_count_data['rainfall_amount_(millimetres)'] != 0]
-temp_df_rainfall = temp_df_rainfall[temp_df_rainfall['rainfall_amount_(millimetres)'] != 0]
-q75, q25 = np.percentile(temp_df_rainfall['rainfall_amount_(millimetres)'], [75, 25])
-median = np.median(temp_df_rainfall['rainfall_amount_(millimetres)'])
-
-#   Creating dictionary of rainfall conditions
-rainfall_category_conditions = {
-    'none':
-        (df_crash_count_data['rainfall_amount_(millimetres)'] <= 0),
-    'light':
-        (df_crash_count_data['rainfall_amount_(millimetres)'] <= q25) &
-        (df_crash_count_data['rainfall_amount_(millimetres)'] > 0),
-    'moderate':
-        (df_crash_count_data['rainfall_amount_(millimetres)'] > q25) &
-        (df_crash_count_data['rainfall_amount_(millimetres)'] <= median),
-    'heavy':
-        (df_crash_count_data['rainfall_amount_(millimetres)'] > median) &
-        (df_crash_count_data['rainfall_amount_(millimetres)'] <= q75),
-    'violent':
-        (df_crash_count_data['rainfall_amount_(millimetres)'] > q75)
-}
-#   Adding new rainfall category column to data frame
-df_crash_count_data['rainfall_category'] = np.select(
-    rainfall_category_conditions.values(),
-    rainfall_category_conditions.keys(),
-    default='none'
-)
 
 """
     DATASET 2: Crash Rate
     Columns = average_number_of_cyclists, rainfall, crash_count
 """
-df_crash_rate_data = df_cyclists.copy()
 
-df_crash_rate_data = df_crash_rate_data[
-    ['macarthur_ave_display', 'rainfall_amount_(millimetres)', 'daily_crash_count']]
 
-df_crash_rate_data['crash_rate'] = \
-    (df_crash_rate_data['daily_crash_count']/df_crash_rate_data['macarthur_ave_display']) * 100
+def get_crash_rate_data():
+    """
+    :return: daily crash rate, per 100 cyclists counted on Macarthur Ave, with the day's rainfall category
+    """
+    df_crash_rate_data = get_data_for_vis(1)[1]
 
-df_crash_rate_data['crash_rate'].replace(np.inf, 0, inplace=True)
+    df_crash_rate_data = df_crash_rate_data[
+        ['macarthur_ave_display', 'rainfall_amount_(millimetres)', 'daily_crash_count']]
 
-#   Creating dictionary of rainfall conditions
-temp_df_rainfall = df_crash_rate_data[df_crash_rate_data['rainfall_amount_(millimetres)'] != 0]
-temp_df_rainfall = temp_df_rainfall[temp_df_rainfall['rainfall_amount_(millimetres)'] != 0]
-q75, q25 = np.percentile(temp_df_rainfall['rainfall_amount_(millimetres)'], [75, 25])
-median = np.median(temp_df_rainfall['rainfall_amount_(millimetres)'])
+    df_crash_rate_data['crash_rate'] = \
+        (df_crash_rate_data['daily_crash_count']/df_crash_rate_data['macarthur_ave_display']) * 100
 
-#   Creating dictionary of rainfall conditions
-rainfall_category_conditions = {
-    'none':
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] <= 0),
-    'light':
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] <= q25) &
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] > 0),
-    'moderate':
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] > q25) &
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] <= median),
-    'heavy':
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] > median) &
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] <= q75),
-    'violent':
-        (df_crash_rate_data['rainfall_amount_(millimetres)'] > q75)
-}
-#   Adding new rainfall category column to data frame
-df_crash_rate_data['rainfall_category'] = np.select(
-    rainfall_category_conditions.values(),
-    rainfall_category_conditions.keys(),
-    default='none'
-)
+    df_crash_rate_data['crash_rate'].replace(np.inf, 0, inplace=True)
+
+    #   Adding new rainfall category column to data frame
+    df_crash_rate_data['rainfall_category'] = \
+        rainfall_categories(df_crash_rate_data['rainfall_amount_(millimetres)'])
+
+    return df_crash_rate_data
 
 
 ######################################################################
@@ -300,6 +249,7 @@ def cycling_crashes_by_rainfall(data_set, crash_calc, crash_calc_agg, chart_type
         Input(component_id='rainfall_filter_list', component_property='value')
     ]
 )
+@cache_figures
 def rainfall_crash_count_visuals(crash_calc, chart_type, rainfall_categories):
     """
     :param crash_calc: The crash calculation a user wants to use
@@ -307,7 +257,7 @@ def rainfall_crash_count_visuals(crash_calc, chart_type, rainfall_categories):
     :param rainfall_categories: The selected rainfall category
     :return: rainfall crash vis, rainfall crash calc vis, selected chart style, selected chart value
     """
-    crash_count_data_set = df_crash_count_data.copy()
+    crash_count_data_set = get_crash_cube('rainfall')
     crash_count_data_set = crash_count_data_set[crash_count_data_set['rainfall_category'].isin(rainfall_categories)]
     if crash_calc == 0:
         crash_calc = 'cyclists'
@@ -318,7 +268,7 @@ def rainfall_crash_count_visuals(crash_calc, chart_type, rainfall_categories):
     else:
         crash_calc = 'crash_rate'
         crash_calc_agg = 'mean'
-        crash_calc_data_set = df_crash_rate_data.copy()
+        crash_calc_data_set = get_crash_rate_data()
         crash_calc_data_set = crash_calc_data_set[crash_calc_data_set['rainfall_category'].isin(rainfall_categories)]
         select_chart_style = {'display': 'block'}
         select_chart_value = chart_type
@@ -3,10 +3,10 @@
 import pandas
 
 from cycling_load_data import *
-from suntime import Sun
+from cycling_helper_functions import *
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import numpy
-from math import sin, cos, sqrt, asin, radians
 
 
 
@@ -17,19 +17,156 @@ def weather_data_clean(data, weather_station):
     :return dataframe with weather station data
 
     """
-    weather_data_frame = data[weather_station].get_data()
-    # changing na to zeros to reduce missing values
-    weather_data_frame = weather_data_frame.fillna(0)
-    weather_data_frame['date'] = pandas.to_datetime(weather_data_frame['date_time']).dt.date
+    # the station keeps its data with na changed to zeros (to reduce missing values) already indexed by date
+    daily = data[weather_station].get_daily_data(fill_missing=True)
+    weather_data_frame = daily.reset_index(drop=True)
+    weather_data_frame['date'] = daily.index
     return weather_data_frame
 
 
+def sun_times(dates, lat, long, is_rise_time, zenith=SUN_ZENITH, time_zone=LOCAL_TIME_ZONE):
+    """ this function calculates sunrise or sunset for whole arrays of dates and locations at once, using the same
+    approximation as the suntime package (https://github.com/SatAgro/suntime) so results agree to within a minute
+    :argument array-like of dates, array-like (or single value) of latitudes and longitudes,
+    True for sunrise or False for sunset, sun zenith angle in degrees, time zone name for the local times
+    :return numpy array of the local time of day of the event in seconds since midnight, NaN where the sun never
+    rises or sets
+    """
+    days = pandas.DatetimeIndex(pandas.to_datetime(dates)).normalize()
+    lat = numpy.asarray(lat, dtype='float64')
+    lng_hour = numpy.asarray(long, dtype='float64') / 15
+    to_rad = numpy.pi / 180
+
+    # approximate time of the event from the day of the year
+    t = days.dayofyear.to_numpy() + ((6 if is_rise_time else 18) - lng_hour) / 24
+
+    # sun's mean anomaly, true longitude and declination
+    m = (0.9856 * t) - 3.289
+    sun_long = numpy.mod(m + (1.916 * numpy.sin(to_rad * m)) + (0.020 * numpy.sin(to_rad * 2 * m)) + 282.634, 360)
+    sin_dec = 0.39782 * numpy.sin(to_rad * sun_long)
+    cos_dec = numpy.cos(numpy.arcsin(sin_dec))
+
+    # sun's local hour angle, outside [-1, 1] the sun never rises or sets
+    cos_h = (numpy.cos(to_rad * zenith) - (sin_dec * numpy.sin(to_rad * lat))) / (cos_dec * numpy.cos(to_rad * lat))
+    cos_h = numpy.where(numpy.abs(cos_h) <= 1, cos_h, numpy.nan)
+    if is_rise_time:
+        h = (360 - numpy.arccos(cos_h) / to_rad) / 15
+    else:
+        h = (numpy.arccos(cos_h) / to_rad) / 15
+
+    # sun's right ascension, in the same quadrant as its true longitude
+    ra = numpy.mod(numpy.arctan(0.91764 * numpy.tan(to_rad * sun_long)) / to_rad, 360)
+    ra = (ra + (numpy.floor(sun_long / 90) - numpy.floor(ra / 90)) * 90) / 15
+
+    # local mean time of the event, then UTC hour of the day
+    ut = numpy.mod(h + ra - (0.06571 * t) - 6.622 - lng_hour, 24)
+    ut = numpy.round(ut, 2)
+
+    # shift to local time, using the UTC offset at midday as daylight saving changes overnight
+    midday = (days + pandas.Timedelta(hours=12)).tz_localize(time_zone)
+    utc_offset = (midday.tz_localize(None) - midday.tz_convert('UTC').tz_localize(None)).total_seconds().to_numpy()
+
+    return numpy.round(numpy.mod(ut * 3600 + utc_offset, 86400))
+
+
+# solar events kept in the solar table, as (True for a morning event, sun zenith angle in degrees)
+SOLAR_EVENTS = {'sunrise': (True, SUN_ZENITH),
+                'sunset': (False, SUN_ZENITH),
+                'civil_dawn': (True, CIVIL_TWILIGHT_ZENITH),
+                'civil_dusk': (False, CIVIL_TWILIGHT_ZENITH),
+                'nautical_dawn': (True, NAUTICAL_TWILIGHT_ZENITH),
+                'nautical_dusk': (False, NAUTICAL_TWILIGHT_ZENITH)}
+
+# lighting conditions from lightest to darkest
+LIGHTING_CONDITIONS = ['day', 'civil twilight', 'nautical twilight', 'night']
+
+
+def solar_table(dates, lat, long, table_path=None, bucket_size=SOLAR_BUCKET_SIZE, time_zone=LOCAL_TIME_ZONE):
+    """ this function looks up sunrise, sunset and twilight times (see SOLAR_EVENTS) for each crash from a table
+    keyed by date and location bucket.
+    across the ACT the sun times barely change with location, so each date is calculated once per bucket (a square of
+    bucket_size degrees, using its centre) rather than once per crash. the table is kept on disk so later runs only
+    calculate dates and buckets that aren't in it yet. each row keeps the bucket size, time zone and event zeniths it
+    was calculated with, and rows calculated with other settings are thrown away
+    :argument array-like of dates, latitudes and longitudes, path of the table file (None to not keep one),
+    bucket size in degrees, time zone name for the local times
+    :return dataframe with a column for each solar event in seconds since midnight, one row per input in the same
+    order
+    """
+    keys = pandas.DataFrame({'date': pandas.DatetimeIndex(pandas.to_datetime(dates)).normalize(),
+                             'lat_bucket': numpy.floor(numpy.asarray(lat, dtype='float64') / bucket_size),
+                             'long_bucket': numpy.floor(numpy.asarray(long, dtype='float64') / bucket_size)})
+    key_columns = list(keys.columns)
+    settings = {'bucket_size': bucket_size, 'time_zone': time_zone}
+    settings.update({event + '_zenith': zenith for event, (is_rise_time, zenith) in SOLAR_EVENTS.items()})
+    table_columns = key_columns + list(settings) + list(SOLAR_EVENTS)
+
+    table = pandas.DataFrame(columns=table_columns)
+    if table_path is not None and file_exists(table_path):
+        table = read_csv_to_df(table_path)
+        # a table written with a different layout can't be reused, nor rows calculated with different settings
+        if list(table.columns) != table_columns:
+            table = pandas.DataFrame(columns=table_columns)
+        for setting, value in settings.items():
+            table = table[table[setting] == value]
+    table['date'] = pandas.to_datetime(table['date'])
+    table[['lat_bucket', 'long_bucket']] = table[['lat_bucket', 'long_bucket']].astype('float64')
+
+    # only calculate the date and location buckets that aren't in the table yet
+    needed = keys.dropna().drop_duplicates()
+    missing = needed.merge(table[key_columns], how='left', indicator=True)
+    missing = missing.loc[missing['_merge'] == 'left_only', key_columns]
+
+    if len(missing):
+        centre_lat = (missing['lat_bucket'] + 0.5) * bucket_size
+        centre_long = (missing['long_bucket'] + 0.5) * bucket_size
+        for setting, value in settings.items():
+            missing[setting] = value
+        for event, (is_rise_time, zenith) in SOLAR_EVENTS.items():
+            missing[event] = sun_times(missing['date'], centre_lat, centre_long, is_rise_time, zenith, time_zone)
+        table = pandas.concat([table, missing], ignore_index=True)
+        if table_path is not None:
+            write_df_to_csv(table, table_path)
+
+    return keys.merge(table, on=key_columns, how='left')[list(SOLAR_EVENTS)]
+
+
+def lighting_condition(time, sun):
+    """ this function classifies the natural light at each crash as day (between sunrise and sunset), civil
+    twilight, nautical twilight or night, all at once from the crash times and solar table
+    :argument timedelta64 times since midnight, dataframe of solar event times from solar_table (same row order)
+    :return ordered categorical of LIGHTING_CONDITIONS, missing where the time is unknown
+    """
+    seconds = pandas.to_timedelta(time).dt.total_seconds().to_numpy()
+    day = (sun['sunrise'].to_numpy() <= seconds) & (seconds <= sun['sunset'].to_numpy())
+    civil = (sun['civil_dawn'].to_numpy() <= seconds) & (seconds <= sun['civil_dusk'].to_numpy())
+    nautical = (sun['nautical_dawn'].to_numpy() <= seconds) & (seconds <= sun['nautical_dusk'].to_numpy())
+    lighting = numpy.select([day, civil, nautical], LIGHTING_CONDITIONS[:3], LIGHTING_CONDITIONS[3]).astype(object)
+    lighting[numpy.isnan(seconds)] = None
+    return pandas.Categorical(lighting, categories=LIGHTING_CONDITIONS, ordered=True)
+
+
+def station_weather_table(weather):
+    """ this function combines the cleaned data of every weather station into one table, so crashes can be joined
+    onto the weather of their closest station in a single merge
+    :argument weather class data
+    :return dataframe of all stations' weather, keyed by 'closest weather station' (the station description) and
+    'date'
+    """
+    station_frames = list()
+    for station in weather:
+        station_frame = weather_data_clean(weather, station)
+        station_frame.insert(0, 'closest weather station', station)
+        station_frames.append(station_frame)
+    return pandas.concat(station_frames, ignore_index=True)
+
+
 def estimating_cyclist_number(cyclist_data):
     """ this function takes the input given by the 'ACT government Bike Barometer - MacArthur Avenue'
     :argument  ACT government Bike Barometer - MacArthur Avenue
     :return a pandas df with sum's of daily bike usage
     """
-    cyclist_data['date'] = pandas.to_datetime(cyclist_data['date_time']).dt.date
+    cyclist_data['date'] = pandas.to_datetime(cyclist_data['date_time']).dt.normalize()
     cyclist_data_sum_by_date = cyclist_data.groupby('date')['macarthur_ave_display'].sum()
     cyclist_data_sum_by_date = cyclist_data_sum_by_date.to_frame().reset_index()
 
@@ -41,7 +178,7 @@ def sum_of_daily_crashes(crash_data):
     :argument ACT cyclist Crash Data
     :return pandas df with sum of daily bike crash
     """
-    crash_data['date'] = crash_data['date_time'].dt.date
+    crash_data['date'] = crash_data['date_time'].dt.normalize()
     value_counts = crash_data['date'].value_counts(dropna=True, sort=True)
     value_counts = pd.DataFrame(value_counts)
     value_counts = value_counts.reset_index()
@@ -67,118 +204,290 @@ def estimated_cyclist_number_daily_rainfall_crash_number(cyclist_data, weather,
     weather_and_cyclist_date_crash['daily_crash_count'] = weather_and_cyclist_date_crash['daily_crash_count'].fillna(0)
     return weather_and_cyclist_date_crash
 
-def crash_sun_weather(crash_data, weather):
-    """this function takes the cyclist data, and the weather data
-    this functions uses the Canberra Airport weather station over the Tuggernong station as the canberra airport station
-    is only 8.6km while the tuggernong stations is 18.1km
-
-    :argument  ACT government Bike Barometer - MacArthur Avenue , daily rainfall
-    :return a pandas df with the daily sums of cyclists and the daily rainfall.
+def nearest_weather_station(lat, long, weather):
+    """ this function finds the closest weather station to every point at once, for however many rainfall stations
+    have been loaded
+    :argument array-like of latitudes and longitudes, dictionary of Rainfall objects keyed by station description
+    :return numpy array with the description of the closest station to each point
     """
-    # creating time_Data to 2 values, time and date
-    crash_data['date'] = pandas.to_datetime(crash_data['date_time']).dt.date
-    crash_data['time'] = pandas.to_datetime(crash_data['date_time']).dt.time
-
-    sunset = list()
-    sunrise = list()
-    closest_weather_station = list()
-    # calculating the distance each crash is from each weather station to determine which one is closest
-    for x in crash_data.index:
-        sun = Sun(float(crash_data['lat'][x]), float(crash_data['long'][x]))
-        sun_ss = datetime.time(sun.get_local_sunset_time(crash_data['date'][x]))
-        sun_sr = datetime.time(sun.get_local_sunrise_time(crash_data['date'][x]))
-        distance_cbr_air = weather['canberra airport'].distance_from_station(crash_data['lat'][x],
-                                                                             crash_data['long'][x])
-        distance_tuggeranong = weather['tuggeranong'].distance_from_station(crash_data['lat'][x],
-                                                                            crash_data['long'][x])
-        sunset.append(sun_ss)
-        sunrise.append(sun_sr)
-        if distance_cbr_air < distance_tuggeranong:
-            closest_weather_station.append("canberra airport")
-        else:
-            closest_weather_station.append("tuggeranong")
-
-    crash_data['sunset'] = sunset
-    crash_data['sunrise'] = sunrise
-    crash_data['closest weather station'] = closest_weather_station
-    # creating two dataframes and adding the weather information to the date and crash information
-    weather_tug = crash_data[crash_data['closest weather station'] == 'tuggeranong']
-    weather_cbra = crash_data[crash_data['closest weather station'] == 'canberra airport']
-    weather_tug = pandas.merge(weather_tug, weather_data_clean(weather, 'tuggeranong'), on="date", how="left")
-    weather_cbra = pandas.merge(weather_cbra, weather_data_clean(weather, 'canberra airport'), on="date", how="left")
-    crash_weather_df = pandas.concat([weather_cbra, weather_tug], ignore_index=True)
-    # creating a binary indicator to whether it is dark or not. this has been
-    # caclulated that is is dark exactly after sunset and only before sunrise.
-    # this was done to reduce the number of street lights we need to calcuated
-    crash_weather_df['dark'] = numpy.where((crash_weather_df['sunset'] < crash_weather_df['time']) | (
-            crash_weather_df['sunrise'] > crash_weather_df['time']), 1, 0)
+    stations = list(weather)
+    # distances come out as a stations x points array, the closest is the smallest in each column
+    distances = numpy.vstack([weather[station].distance_from_station(numpy.asarray(lat, dtype='float64'),
+                                                                     numpy.asarray(long, dtype='float64'))
+                              for station in stations])
+    return numpy.array(stations, dtype=object)[numpy.argmin(distances, axis=0)]
+
+
+def rainfall_matrix(weather):
+    """ this function builds a table of daily rainfall with a row for every date and a column for every station
+    :argument dictionary of Rainfall objects keyed by station description
+    :return pandas df indexed by date (datetime64) with the rainfall in mm of each station, NaN where the station
+    has no reading for the day
+    """
+    station_rainfall = dict()
+    for station in weather:
+        rainfall = weather[station].get_daily_data()['rainfall_amount_(millimetres)']
+        station_rainfall[station] = rainfall[~rainfall.index.duplicated()]
+    return pandas.DataFrame(station_rainfall).sort_index()
+
+
+def rainfall_idw(dates, lat, long, weather, neighbours=RAINFALL_IDW_NEIGHBOURS, power=RAINFALL_IDW_POWER):
+    """ this function estimates the rainfall at every crash as the inverse distance weighted average of the daily
+    rainfall at the closest stations that have a reading for that day. it works on whole arrays of crashes at once
+    so scales to any number of stations
+    :argument array-like of dates, latitudes and longitudes, dictionary of Rainfall objects keyed by station
+    description, number of closest stations to use, power of the distance weighting
+    :return numpy array of rainfall in mm, NaN where no station has a reading for the day
+    """
+    matrix = rainfall_matrix(weather)
+    days = pandas.DatetimeIndex(pandas.to_datetime(dates)).normalize()
+    # crashes x stations arrays of the day's rainfall and the distance to each station
+    readings = matrix.reindex(days).to_numpy(dtype='float64')
+    distances = numpy.column_stack([weather[station].distance_from_station(numpy.asarray(lat, dtype='float64'),
+                                                                           numpy.asarray(long, dtype='float64'))
+                                    for station in matrix.columns])
+
+    # stations without a reading are pushed to the back so only valid ones are picked as neighbours
+    distances = numpy.where(numpy.isnan(readings), numpy.inf, distances)
+    closest = numpy.argsort(distances, axis=1, kind='stable')[:, :neighbours]
+    distances = numpy.take_along_axis(distances, closest, axis=1)
+    readings = numpy.take_along_axis(readings, closest, axis=1)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        weights = numpy.where(numpy.isfinite(distances), 1 / distances ** power, 0)
+        # a crash right on top of a station just takes that station's reading
+        on_station = distances == 0
+        weights = numpy.where(on_station.any(axis=1, keepdims=True), on_station.astype('float64'), weights)
+        total_weight = weights.sum(axis=1)
+        estimate = numpy.nansum(weights * readings, axis=1) / total_weight
+
+    estimate[total_weight == 0] = numpy.nan
+    return estimate
+
+
+def split_date_time(date_time):
+    """ this function splits crash date times into 2 values, date and time. these are kept as numpy types (the date as
+    a datetime64 at midnight and the time as a timedelta64 since midnight) so comparisons and merges on them are fast
+    :argument series of date times
+    :return series of dates, series of times
+    """
+    date_time = pandas.to_datetime(date_time)
+    date = date_time.dt.normalize()
+    return date, date_time - date
+
+
+def crash_solar(crash_data, bucket_size=SOLAR_BUCKET_SIZE, time_zone=LOCAL_TIME_ZONE):
+    """ this function looks up sunset and sunrise for every crash from the stored solar table and classifies the
+    natural light at the time of the crash (see lighting_condition)
+    :argument ACT cyclist Crash data, size of the location buckets of the solar table in degrees, time zone name for
+    the local times
+    :return dataframe with the same index as the crash data of 'sunset' and 'sunrise' (timedelta64 since midnight) and
+    'lighting'
+    """
+    date, time = split_date_time(crash_data['date_time'])
+    sun = solar_table(date, crash_data['lat'], crash_data['long'], Path(DATA_FOLDER) / SOLAR_TABLE, bucket_size,
+                      time_zone)
+
+    solar = pandas.DataFrame(index=crash_data.index)
+    solar['sunset'] = pandas.to_timedelta(sun['sunset'].to_numpy(), unit='s')
+    solar['sunrise'] = pandas.to_timedelta(sun['sunrise'].to_numpy(), unit='s')
+    solar['lighting'] = lighting_condition(time, sun.set_index(crash_data.index))
+    return solar
+
+
+def crash_weather(crash_data, weather, neighbours=RAINFALL_IDW_NEIGHBOURS, power=RAINFALL_IDW_POWER):
+    """this function takes the crash data, and the weather data
+    each crash takes the rainfall of its closest weather station, plus an inverse distance weighted estimate from
+    all stations (see rainfall_idw)
+
+    :argument ACT cyclist Crash data, daily rainfall, number of stations and power of the distance weighting for the
+    rainfall estimate
+    :return dataframe with the same index as the crash data of the closest weather station, the rainfall estimate and
+    the weather of the closest station on the day of the crash
+    """
+    date, _ = split_date_time(crash_data['date_time'])
+    closest_weather_station = nearest_weather_station(crash_data['lat'], crash_data['long'], weather)
+    keys = pandas.DataFrame({'closest weather station': closest_weather_station, 'date': date.to_numpy()})
+
+    # adding the weather information of the closest station on the day of each crash, keeping the crash order. a
+    # station only gets one reading a day so every crash matches at most one row
+    station_weather = station_weather_table(weather).drop_duplicates(['closest weather station', 'date'])
+    crash_weather_df = keys.merge(station_weather, on=['closest weather station', 'date'], how='left')
+    crash_weather_df = crash_weather_df.drop(columns='date').set_index(crash_data.index)
+    crash_weather_df.insert(1, 'rainfall_idw_(millimetres)',
+                            rainfall_idw(date, crash_data['lat'], crash_data['long'], weather, neighbours, power))
     return crash_weather_df
 
 
-def add_class_suburb(crash_data, suburb):
+# objects shared by every chunk run in a worker process (eg. the suburb shapes), set once when each worker starts
+# rather than being sent along with every chunk
+_worker_shared = tuple()
+
+
+def _set_worker_shared(*shared):
+    """ pool initializer, keeps the shared objects in the worker process
+    """
+    global _worker_shared
+    _worker_shared = shared
+
+
+def _run_worker_chunk(function, chunk, kwargs):
+    """ runs function on a chunk of crashes in a worker process, along with the shared objects
+    """
+    return function(chunk, *_worker_shared, **kwargs)
+
+
+def map_crash_chunks(function, crash_data, shared, workers=INTEGRATION_WORKERS, chunk_size=INTEGRATION_CHUNK_SIZE,
+                     **kwargs):
+    """ this function runs function(crashes, *shared, **kwargs) over chunks of the crash data across a pool of worker
+    processes, with the shared objects sent to each worker once, and joins the resulting dataframes back up in the
+    order of the crash data. with no more than one worker, or a single chunk of crashes, it is just called directly
+    :argument function returning a dataframe with the same index as the crashes it is given, crash data, tuple of
+    objects to pass to every call after the crashes, number of worker processes, number of crashes in each chunk,
+    any keyword arguments for the function
+    :return the joined up dataframe
+    """
+    if workers is None or workers <= 1 or len(crash_data) <= chunk_size:
+        return function(crash_data, *shared, **kwargs)
+
+    chunks = [crash_data.iloc[start:start + chunk_size] for start in range(0, len(crash_data), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_shared, initargs=shared) as executor:
+        results = executor.map(_run_worker_chunk, [function] * len(chunks), chunks, [kwargs] * len(chunks))
+        return pandas.concat(list(results))
+
+
+def locate_suburbs(crash_data, suburb):
+    """"
+    finds the suburb and district of each crash, '' where there isn't one
+    :argument crash data with lat and long, suburb class
+    :return dataframe with the same index as the crash data of 'suburb' and 'district'
+    """
+    # locating the whole table in one batch is much faster than point by point
+    located = suburb.locate(crash_data[['lat', 'long']])
+    return located[['suburb', 'district']]
+
+
+def add_class_suburb(crash_data, suburb, workers=INTEGRATION_WORKERS):
     """"
     add the suburbs based on long lat and not what the report says
+    :argument ACT cyclist Crash data, suburb class, number of worker processes to share the crashes between
+    :return dataframe with the same index as the crash data of 'suburb' and 'district'
+    """
+    located = map_crash_chunks(locate_suburbs, crash_data[['lat', 'long']], (suburb,), workers)
+    suburbs = pandas.DataFrame(index=crash_data.index)
+    # chunks found in different processes each have their own categories, so they're worked out again for the lot.
+    # if there is no suburb information mark it as NA
+    suburbs['suburb'] = pandas.Categorical(located['suburb']).rename_categories({'': 'NA'})
+    suburbs['district'] = pandas.Categorical(located['district'])
+    return suburbs
+
+
+def streetlight_column(radius):
+    """ returns the name of the street light count column for a given radius in km, eg. 'lights_within_30m'
+    """
+    return f'lights_within_{radius * 1000:g}m'
+
+
+def streetlight_features(crash_data, light_index, radii, search_limit=STREETLIGHT_SEARCH_LIMIT):
+    """"
+    This function counts the street lights around every crash for each of a list of radii, and finds the distance to
+    the nearest light, in a single pass over the street light index
+    :argument crash data with lat and long, PointIndex of the street lights, list of radii in km, furthest distance
+    in km to look for the nearest light
+    :return dataframe with the same index as the crash data, a count column for each radius (see streetlight_column)
+    and 'nearest_light_km' (NaN if there is no light within the search limit)
     """
-    lat_long = (crash_data[['lat', 'long']]).values.tolist()
-    def suburb_iter(data):
-        """"used for getting the suburb by the geolocation as defined in suburb class
-        faster than a traditional loop"""
-        return list(suburb.locate(data[0], data[1]).values())
-    # using a map function over a loop as its faster
-    suburb_list = [item for sublist in (list(map(suburb_iter, lat_long))) for item in sublist]
-    crash_data['suburb'] = suburb_list[::2]
-    crash_data['district'] = suburb_list[1::2]
-    # if there is no suburb information take the district
-    #crash_data.loc[crash_data['suburb'] == '', 'suburb'] = crash_data['district']
-    crash_data.loc[crash_data['suburb'] == '', 'suburb'] = "NA"
-    return crash_data
-
-
-def lights_final(crash, rain, suburb, lights):
+    lat = crash_data['lat'].to_numpy(dtype='float64')
+    long = crash_data['long'].to_numpy(dtype='float64')
+    # one query at the largest radius finds every pair needed for the smaller ones too
+    query, _, distance = light_index.pairs_within(lat, long, max(radii))
+
+    features = pandas.DataFrame(index=crash_data.index)
+    for radius in sorted(radii):
+        features[streetlight_column(radius)] = numpy.bincount(query[distance < radius], minlength=len(lat))
+
+    nearest = numpy.full(len(lat), numpy.inf)
+    numpy.minimum.at(nearest, query, distance)
+    # only crashes with no light inside the largest radius need a wider search
+    no_light = ~numpy.isfinite(nearest)
+    nearest[no_light] = light_index.nearest_distance(lat[no_light], long[no_light], search_limit)
+    features['nearest_light_km'] = nearest
+    return features
+
+
+def crash_streetlights(crash_data, lights, radii, search_limit=STREETLIGHT_SEARCH_LIMIT, workers=INTEGRATION_WORKERS):
     """"
-    This function takes the crash, rainfall, suburb, and street light data
-    and returns a final product dataframe which contains all bike crash data with their daily rainfall,
-    which suburb they are in, and if it is dark how many street lights were within 30 meters
-    :argument bike-crash data, rainfall data, suburb class, street light data
+    This function counts the street lights around every crash (see streetlight_features)
+    :argument crash data with lat and long, street light data, list of radii in km, furthest distance in km to look
+    for the nearest light, number of worker processes to share the crashes between
+    :return dataframe with the same index as the crash data of the street light features
+    """
+    # bucketing the street lights by location means each crash only needs to
+    # check the lights close by, rather than every light in the ACT
+    light_index = PointIndex(lights['lat'], lights['long'], STREETLIGHT_RADIUS)
+    return map_crash_chunks(streetlight_features, crash_data[['lat', 'long']], (light_index,), workers, radii=radii,
+                            search_limit=search_limit)
+
+
+def combine_crash_data(crash, solar, weather, suburbs, streetlights, radius=STREETLIGHT_RADIUS):
+    """"
+    This function takes the crash data and the columns worked out for it by crash_solar, crash_weather,
+    add_class_suburb and crash_streetlights, and returns a final product dataframe which contains all bike crash data
+    with their daily rainfall, which suburb they are in, and if it is dark how many street lights were within the
+    radius.
+    :argument bike-crash data, solar, weather, suburb and street light columns of the crash data, radius in km of
+    the street light count for dark crashes
     :return single dataframe containing crash, streetlight, rainfall and suburb class data
     """
-    crash_final = add_class_suburb((crash_sun_weather(crash, rain)), suburb)
+    crash_final = crash.copy()
+    crash_final['date'], crash_final['time'] = split_date_time(crash_final['date_time'])
+    crash_final = crash_final.join(solar).join(weather, lsuffix='_x', rsuffix='_y')
+    # creating a binary indicator to whether it is dark or not. this has been
+    # caclulated that is is dark exactly after sunset and only before sunrise.
+    # this was done to reduce the number of street lights we need to calcuated
+    crash_final['dark'] = numpy.where(crash_final['lighting'].isin(LIGHTING_CONDITIONS[1:]), 1, 0)
+    crash_final = crash_final.join(suburbs).join(streetlights)
+
     crash_final_dark = crash_final[crash_final['dark'] == 1]
-    dark_lat_long_list = (crash_final_dark[['lat', 'long', 'crash_id']]).values.tolist()
-    light_list = (lights[['lat', 'long']]).values.tolist()
-
-    R = 6371  # km
-    crash_dict = dict()
-
-    for x in dark_lat_long_list:
-        count = 0
-        for y in light_list:
-            dLat = radians(y[0] - x[0])
-            dLon = radians(y[1] - x[1])
-            lat1 = radians(x[0])
-            lat2 = radians(y[0])
-            a = sin(dLat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dLon / 2) ** 2
-            c = 2 * asin(sqrt(a))
-            distance = R * c
-            if distance < 0.03: # 0.03 = 30 meters
-                count += 1
-        crash_dict[int(x[2])] = count
-
-    crash_lights = pandas.DataFrame(list(crash_dict.items()), columns=['crash_id', 'number_of_lights'])
-    crash_final = (crash_final.merge(crash_lights, on='crash_id', how='left')).fillna(-1)
+    crash_lights = pandas.DataFrame({'crash_id': crash_final_dark['crash_id'].astype('int64').to_numpy(),
+                                     'number_of_lights': crash_final_dark[streetlight_column(radius)].to_numpy()})
+    crash_lights = crash_lights.drop_duplicates('crash_id', keep='last')
+    crash_final = crash_final.merge(crash_lights, on='crash_id', how='left')
+    # categorical location columns have no missing values and can't take -1, nor can dates and times
+    fill_columns = crash_final.select_dtypes(exclude=['category', 'datetime', 'timedelta']).columns
+    crash_final[fill_columns] = crash_final[fill_columns].fillna(-1)
     return crash_final
 
 
+def lights_final(crash, rain, suburb, lights, workers=INTEGRATION_WORKERS):
+    """"
+    This function takes the crash, rainfall, suburb, and street light data
+    and returns a final product dataframe which contains all bike crash data with their daily rainfall,
+    which suburb they are in, and if it is dark how many street lights were within 30 meters.
+    street light counts for every radius in STREETLIGHT_RADII, and the distance to the nearest light, are added for
+    all crashes
+    :argument bike-crash data, rainfall data, suburb class, street light data, number of worker processes to share
+    the suburb and street light work between
+    :return single dataframe containing crash, streetlight, rainfall and suburb class data
+    """
+    radii = sorted(set(STREETLIGHT_RADII) | {STREETLIGHT_RADIUS})
+    return combine_crash_data(crash, crash_solar(crash), crash_weather(crash, rain),
+                              add_class_suburb(crash, suburb, workers),
+                              crash_streetlights(crash, lights, radii, workers=workers))
+
+
 
 # they're used in main to check for local data dump files to improve efficiency
 # on subsequent executions
-def integration(data):
+def integration(data, workers=INTEGRATION_WORKERS):
     """" this is the final function, calling this will return a dictionary containing two dataframes,
-    1 the estimated cyclist data and two the bike crash data
+    1 the estimated cyclist data and two the bike crash data. the suburb and street light work can be shared between
+    a number of worker processes
     """
     data_integration_dic = dict()
     data_integration_dic['cyclists'] = estimated_cyclist_number_daily_rainfall_crash_number(data['cyclist'], data['rainfall'], data['crash'])
-    data_integration_dic['crashes'] = lights_final(data['crash'], data['rainfall'], data['suburb'], data['streetlight'])
+    data_integration_dic['crashes'] = lights_final(data['crash'], data['rainfall'], data['suburb'], data['streetlight'],
+                                                  workers)
 
     return data_integration_dic
 
@@ -18,4 +18,69 @@ DATA_FOLDER = 'data'
 
 # CSV file to create containing information on local data sets (eg. type, path) 
 # path of file is relative to DATA_FOLDER
-DATA_INDEX = 'local_data.csv'
\ No newline at end of file
+DATA_INDEX = 'local_data.csv'
+
+# file to cache the processed suburb shapefile in, to save rebuilding it on
+# every run
+# path of file is relative to DATA_FOLDER
+SUBURB_CACHE = 'suburb_cache.pickle'
+
+# cell size, in degrees, of the raster grid used to speed up locating points
+# by suburb and district (0.001 is roughly 100m), set to None to disable
+SUBURB_GRID_CELL_SIZE = 0.001
+
+# distance in km within which street lights are counted around a crash
+STREETLIGHT_RADIUS = 0.03
+
+# additional distances in km to count street lights within, each one adds a
+# 'lights_within_<metres>m' column to the crash data
+STREETLIGHT_RADII = [0.01, 0.03, 0.05, 0.1]
+
+# furthest distance in km to search for the nearest street light to a crash
+STREETLIGHT_SEARCH_LIMIT = 2.0
+
+# time zone that crash times are recorded in, used for sunrise and sunset
+LOCAL_TIME_ZONE = 'Australia/Canberra'
+
+# sun zenith angle in degrees at sunrise and sunset, and at the end of civil
+# and nautical twilight
+SUN_ZENITH = 90.8
+CIVIL_TWILIGHT_ZENITH = 96
+NAUTICAL_TWILIGHT_ZENITH = 102
+
+# file to store calculated sunrise and sunset times by date and location in
+# path of file is relative to DATA_FOLDER
+SOLAR_TABLE = 'solar_table.csv'
+
+# size in degrees of the location buckets sun times are calculated for (0.05 
+# degrees of longitude shifts sunrise and sunset by about 12 seconds)
+SOLAR_BUCKET_SIZE = 0.05
+
+# number of closest weather stations, and the power of the distance weighting,
+# used to estimate the rainfall at each crash
+RAINFALL_IDW_NEIGHBOURS = 3
+RAINFALL_IDW_POWER = 2
+
+# folder to cache the output of each stage of the integration pipeline in,
+# keyed by a hash of the stage inputs and parameters
+# path of folder is relative to DATA_FOLDER
+PIPELINE_CACHE = 'pipeline_cache'
+
+# file in the PIPELINE_CACHE folder to keep the last integrated crash table in,
+# so the next run can integrate only the new crashes
+INCREMENTAL_CACHE = 'crashes_incremental.pickle'
+
+# only integrate crashes that weren't in the last integrated crash table, the
+# crashes already integrated aren't updated for changes to the other data
+INCREMENTAL_INTEGRATION = False
+
+# number of worker processes to share the suburb and street light stages of
+# the integration between, None (or 1) runs them in the main process
+INTEGRATION_WORKERS = None
+
+# number of crashes sent to a worker process at a time
+INTEGRATION_CHUNK_SIZE = 2000
+
+# memory budget, in bytes, of the dashboard's cache of callback figures; the
+# least recently used figures are dropped to stay within it, 0 turns it off
+FIGURE_CACHE_SIZE = 64 * 1024 * 1024
\ No newline at end of file
@@ -10,8 +10,22 @@ General helper functions, not module specific
 
 
 from pathlib import Path
+import importlib
 import pandas as pd
 
+# the columnar Feather format needs pyarrow, an optional dependency (see 
+# README.md), so tables are stored as CSV when it can't be imported, eg. when
+# it isn't installed or was built for another version of numpy
+try:
+    importlib.import_module('pyarrow')
+    FEATHER_AVAILABLE = True
+except ImportError:
+    FEATHER_AVAILABLE = False
+
+# file extensions of the formats processed tables can be stored in
+TABLE_FORMATS = {'feather': '.feather',
+                 'csv': '.csv'}
+
 
 ##############################################################################
 #                               HELPER FUNCTIONS                             #
@@ -39,6 +53,36 @@ def file_exists(file):
     return file_path.is_file()
 
 
+def format_time_columns(df):
+    """
+    Returns a copy of a DataFrame with any timedelta columns converted to 
+    'HH:MM:SS' clock time strings, or the DataFrame itself if there are none.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to format.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The formatted data.
+
+    """
+    
+    time_columns = df.select_dtypes(include='timedelta').columns
+    
+    if not len(time_columns):
+        return df
+    
+    df = df.copy()
+    
+    for column in time_columns:
+        df[column] = (pd.Timestamp(0) + df[column]).dt.strftime('%H:%M:%S')
+        
+    return df
+
+
 def read_csv_to_df(file):
     """
     Loads a CSV file into a pandas DataFrame.
@@ -61,6 +105,9 @@ def read_csv_to_df(file):
 def write_df_to_csv(df, file):
     """
     Writes a pandas DataFrame to a CSV file.
+    
+    Any timedelta columns (eg. times of day held as time since midnight) are
+    written as 'HH:MM:SS' clock times.
 
     Parameters
     ----------
@@ -76,9 +123,168 @@ def write_df_to_csv(df, file):
     """
     
     file_path = Path(file)
+    df = format_time_columns(df)
     df.to_csv(file_path, header=True, index=True)
     
 
+def read_feather_to_df(file):
+    """
+    Loads a Feather file into a pandas DataFrame, with the column types it 
+    was written with.
+
+    Parameters
+    ----------
+    file : str or path
+        Path/name of file to load.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The loaded data.
+
+    """
+    
+    file_path = Path(file)
+    return pd.read_feather(file_path)
+
+
+def write_df_to_feather(df, file):
+    """
+    Writes a pandas DataFrame to a Feather file, a columnar format that keeps
+    the column types (eg. dates, times, categories) and is much faster to
+    load than CSV.  Requires pyarrow.
+    
+    Feather can't store an index, so any index other than the default 0, 1, 
+    2, ... is reset to a column first.  Nor can it store columns mixing text
+    with numbers (eg. text with missing values filled by -1), so the values
+    of these are written as text, with missing values left missing, as they 
+    would read back from CSV.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to write.
+    file : str or path
+        Output file.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    file_path = Path(file)
+    
+    if df.index.name is not None or not df.index.equals(pd.RangeIndex(len(df))):
+        df = df.reset_index()
+        
+    mixed_columns = [column for column in df.select_dtypes(include='object').columns
+                     if pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')]
+    
+    if mixed_columns:
+        df = df.copy()
+        
+        # missing values stay missing rather than becoming the text 'nan'
+        for column in mixed_columns:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        
+    df.to_feather(file_path)
+
+
+def table_format(columnar=None):
+    """
+    Returns the format to store processed tables in: Feather if pyarrow is 
+    available, otherwise CSV.
+
+    Parameters
+    ----------
+    columnar : bool, optional
+        Whether to use the columnar format, CSV if False.  The default is 
+        None, columnar when available.
+
+    Returns
+    -------
+    str
+        A key of TABLE_FORMATS.
+
+    """
+    
+    if columnar is None:
+        columnar = FEATHER_AVAILABLE
+        
+    return 'feather' if columnar else 'csv'
+
+
+def table_path(folder, table_name, columnar=None):
+    """
+    Returns the path to store a processed table in, with the extension of the
+    format given by 'table_format'.
+
+    Parameters
+    ----------
+    folder : str or path
+        Folder to store the table in.
+    table_name : str
+        Name of the table, eg. 'crashes'.
+    columnar : bool, optional
+        Whether to use the columnar format, CSV if False.  The default is 
+        None, columnar when available.
+
+    Returns
+    -------
+    Path
+        Path to the table file.
+
+    """
+    
+    return Path(folder) / (table_name + TABLE_FORMATS[table_format(columnar)])
+
+
+def read_table_to_df(file):
+    """
+    Loads a processed table from a Feather or CSV file, by its extension.
+
+    Parameters
+    ----------
+    file : str or path
+        Path/name of file to load.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The loaded data.
+
+    """
+    
+    if Path(file).suffix.lower() == TABLE_FORMATS['feather']:
+        return read_feather_to_df(file)
+    
+    return read_csv_to_df(file)
+
+
+def write_df_to_table(df, file):
+    """
+    Writes a processed table to a Feather or CSV file, by its extension.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to write.
+    file : str or path
+        Output file.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    if Path(file).suffix.lower() == TABLE_FORMATS['feather']:
+        write_df_to_feather(df, file)
+    else:
+        write_df_to_csv(df, file)
+
+
 def read_excel_to_df(file):
     """
     Loads an Excel sheet into a pandas DataFrame.
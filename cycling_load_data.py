@@ -33,16 +33,29 @@ The index can be automatically generated by the 'cycling_download_data' module.
 """
 
 import csv
+import hashlib
+import pickle
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from math import radians, cos, sin, asin, sqrt
 import shapefile
+import shapely
 from shapely.geometry import shape, Point
+from shapely.prepared import prep
+from shapely import wkb
+from shapely.strtree import STRtree
+from numbers import Integral
 from collections import defaultdict
 import json
 
 from cycling_globals import *
 
+# radius of the Earth in km
+EARTH_RADIUS = 6371
+
+# shapely 2 provides vectorised geometry creation and tree queries
+VECTORISED_SHAPELY = hasattr(shapely, 'points')
+
 
 ##############################################################################
 #                               HELPER FUNCTIONS                             #
@@ -72,6 +85,42 @@ def clean_column_name(column_name):
     return column_name
 
 
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Returns the great circle distance between pairs of points given by their
+    latitude and longitude.  Inputs may be floats or equal length arrays.
+
+    Parameters
+    ----------
+    lat1 : float or array-like of float
+        Latitude of the first point(s).
+    lon1 : float or array-like of float
+        Longitude of the first point(s).
+    lat2 : float or array-like of float
+        Latitude of the second point(s).
+    lon2 : float or array-like of float
+        Longitude of the second point(s).
+
+    Returns
+    -------
+    distance : float or numpy.ndarray of float
+        Distance in km between each pair of points.
+
+    """
+    
+    d_lat = np.radians(np.subtract(lat2, lat1))
+    d_lon = np.radians(np.subtract(lon2, lon1))
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    
+    a = np.sin(d_lat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(d_lon/2)**2
+    c = 2*np.arcsin(np.sqrt(a))
+    
+    distance = EARTH_RADIUS * c
+    
+    return distance
+
+
 def read_data_index_csv(csv_file_name):
     """
     Reads a CSV file containing details of the local data sources and returns
@@ -308,9 +357,11 @@ class Rainfall:
         height.
     The primary data is a: 
         DataFrame containing daily rainfall measurements.
+    Which is also kept as a date-indexed, numerically typed daily table.
     Methods include:
-        distance_from_station - the haversine distance from any point
-                                by lat/long to the weather station.
+        distance_from_station - the haversine distance from any point, or 
+                                array of points, by lat/long to the weather 
+                                station.
     """
     
     def __init__(self, index_listing, data_frame):
@@ -333,6 +384,32 @@ class Rainfall:
         
         self.df = data_frame
         self._read_rainfall_data_notes(index_listing)
+        self._build_daily_data()
+    
+    
+    def _build_daily_data(self):
+        """
+        Builds the daily measurements table, indexed by date (as datetime64
+        rather than Python date objects) with the rainfall amount typed as a
+        float.  A copy with missing values filled with zero is also kept, so
+        neither has to be recalculated each time the data is used.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        daily = self.df.copy()
+        daily.index = pd.DatetimeIndex(pd.to_datetime(daily['date_time'])).normalize()
+        daily.index.name = 'date'
+        
+        rainfall_column = 'rainfall_amount_(millimetres)'
+        if rainfall_column in daily.columns:
+            daily[rainfall_column] = pd.to_numeric(daily[rainfall_column], errors='coerce')
+        
+        self.daily = daily
+        self.daily_filled = daily.fillna(0)
     
     
     def _isfloat(value):
@@ -437,6 +514,31 @@ class Rainfall:
             return self.df
     
     
+    def get_daily_data(self, fill_missing=False):
+        """
+        Returns the date-indexed daily measurements table.  The table is 
+        shared, so should be copied before being modified.
+
+        Parameters
+        ----------
+        fill_missing : bool, optional
+            Return the table with missing values filled with zero. The 
+            default is False.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Daily measurements table indexed by date.
+
+        """
+        
+        if 'id' in self.station:
+            if fill_missing:
+                return self.daily_filled
+            else:
+                return self.daily
+    
+    
     def get_station_id(self):
         """
         Returns station ID.
@@ -549,43 +651,706 @@ class Rainfall:
     
     def distance_from_station(self, lat2, lon2):
         """
-        Returns distance from station to a given latitude and longitude.
+        Returns distance from station to a given latitude and longitude, or 
+        to each of a set of latitudes and longitudes.
 
         Parameters
         ----------
-        lat2 : float
-            Latitude of point of interest.
-        lon2 : float
-            Longitude of point of interest.
+        lat2 : float or array-like of float
+            Latitude of point(s) of interest.
+        lon2 : float or array-like of float
+            Longitude of point(s) of interest.
 
         Returns
         -------
-        distance : float
-            Distance in km from station to point of interest.
+        distance : float or numpy.ndarray or pandas.Series
+            Distance in km from station to point(s) of interest.  A float for
+            a single point, otherwise matching the type of the input.
 
         """
         
         if not 'lat' in self.station or not 'long' in self.station:
             return
-    
-        R = 6371 # radius of the Earth in km
         
-        lat1 = self.station['lat']
-        lon1 = self.station['long']
+        distance = haversine(self.station['lat'], self.station['long'], lat2, lon2)
         
-        dLat = radians(lat2 - lat1)
-        dLon = radians(lon2 - lon1)
-        lat1 = radians(lat1)
-        lat2 = radians(lat2)
-  
-        a = sin(dLat/2)**2 + cos(lat1)*cos(lat2)*sin(dLon/2)**2
-        c = 2*asin(sqrt(a))
-  
-        distance = R * c
+        if np.ndim(distance) == 0:
+            return float(distance)
         
         return distance
         
 
+##############################################################################
+#                             POLYGON INDEX CLASS                            #
+##############################################################################
+
+class PolygonIndex:
+    """
+    Class to hold a subset of shapefile polygons in an STRtree spatial index
+    alongside their prepared geometries, so a point only has to be tested
+    against the few polygons whose bounding boxes contain it.
+    
+    Polygons are kept in shapefile record order and searches always return
+    the first matching polygon in that order, the same result as a linear 
+    scan over the records.
+    
+    Optionally a raster grid can be built over the polygons, so that points 
+    in cells that no polygon boundary passes through are located by a simple
+    array lookup, with exact polygon tests only needed near boundaries.
+    """
+    
+    # grid cell values for cells outside all polygons, and for cells that a
+    # polygon boundary passes through
+    grid_outside = -1
+    grid_boundary = -2
+    
+    def __init__(self, geometries, record_indexes):
+        """
+        Builds the spatial index for the given shapefile records.
+
+        Parameters
+        ----------
+        geometries : list of shapely.geometry
+            Geometries for every record in the shapefile.
+        record_indexes : iterable of int
+            The shapefile record indexes to include in the index.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.record_indexes = list(record_indexes)
+        self.geometries = [geometries[i] for i in self.record_indexes]
+        self.prepared = [prep(geometry) for geometry in self.geometries]
+        self.tree = STRtree(self.geometries)
+        
+        # older versions of shapely return the geometries themselves from a
+        # tree query rather than their positions, so keep a reverse mapping
+        self.__positions = {id(geometry): k for k, geometry in enumerate(self.geometries)}
+        
+        self.grid = None
+        self.grid_origin = None
+        self.grid_cell_size = None
+        
+        
+    def candidates(self, geometry):
+        """
+        Returns the positions (in record order) of the indexed polygons whose
+        bounding boxes intersect the given geometry.
+
+        Parameters
+        ----------
+        geometry : shapely.geometry
+            The geometry to search for.
+
+        Returns
+        -------
+        list of int
+            Sorted positions of the candidate polygons within this index.
+
+        """
+        
+        positions = [item if isinstance(item, Integral) else self.__positions[id(item)]
+                     for item in self.tree.query(geometry)]
+        
+        return sorted(positions)
+    
+    
+    def locate(self, point):
+        """
+        Finds the first indexed polygon that contains a point.
+
+        Parameters
+        ----------
+        point : shapely.geometry.Point
+            The point to locate.
+
+        Returns
+        -------
+        int or None
+            The shapefile record index of the containing polygon, None if
+            the point isn't within any indexed polygon.
+
+        """
+        
+        if self.grid is not None:
+            value = self.grid_lookup(np.array([point.x]), np.array([point.y]))[0]
+            
+            if value == PolygonIndex.grid_outside:
+                return None
+            elif value != PolygonIndex.grid_boundary:
+                return int(value)
+        
+        for k in self.candidates(point):
+            if self.prepared[k].contains(point):
+                return self.record_indexes[k]
+            
+        return None
+    
+    
+    def locate_many(self, x, y):
+        """
+        Finds the first indexed polygon that contains each of a set of points
+        in a single batched operation.  If a grid has been built, only points
+        in boundary cells are tested against the polygons.
+
+        Parameters
+        ----------
+        x : array-like of float
+            Point x coordinates (longitude).
+        y : array-like of float
+            Point y coordinates (latitude).
+
+        Returns
+        -------
+        found : numpy.ndarray of int
+            The shapefile record index of the containing polygon for each
+            point, -1 where the point isn't within any indexed polygon.
+
+        """
+        
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        
+        if self.grid is None:
+            return self.__locate_exact_many(x, y)
+        
+        found = self.grid_lookup(x, y).astype('int64')
+        exact = found == PolygonIndex.grid_boundary
+        found[exact] = self.__locate_exact_many(x[exact], y[exact])
+        
+        return found
+    
+    
+    def __locate_exact_many(self, x, y):
+        """
+        Tests a set of points against the indexed polygons.
+        
+        With shapely 2 the whole array of points is queried against the tree
+        at once, otherwise each polygon is tested against only those points
+        that fall inside its bounding box.
+
+        Parameters
+        ----------
+        x : array-like of float
+            Point x coordinates (longitude).
+        y : array-like of float
+            Point y coordinates (latitude).
+
+        Returns
+        -------
+        found : numpy.ndarray of int
+            The shapefile record index of the containing polygon for each
+            point, -1 where the point isn't within any indexed polygon.
+
+        """
+        
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        found = np.full(len(x), -1, dtype='int64')
+        
+        if not self.record_indexes or not len(x):
+            return found
+        
+        record_indexes = np.asarray(self.record_indexes, dtype='int64')
+        
+        if VECTORISED_SHAPELY:
+            points = shapely.points(x, y)
+            point_pos, tree_pos = self.tree.query(points, predicate='within')
+            
+            # keep the first polygon in record order for each point
+            order = np.lexsort((tree_pos, point_pos))
+            point_pos = point_pos[order]
+            tree_pos = tree_pos[order]
+            _, first = np.unique(point_pos, return_index=True)
+            
+            found[point_pos[first]] = record_indexes[tree_pos[first]]
+        else:
+            for k, geometry in enumerate(self.geometries):
+                min_x, min_y, max_x, max_y = geometry.bounds
+                in_box = np.flatnonzero((found < 0) & 
+                                        (x >= min_x) & (x <= max_x) & 
+                                        (y >= min_y) & (y <= max_y))
+                
+                for i in in_box:
+                    if self.prepared[k].contains(Point(x[i], y[i])):
+                        found[i] = record_indexes[k]
+                
+        return found
+    
+    def build_grid(self, bounds, cell_size):
+        """
+        Builds a raster grid of fixed size cells over the given bounds.  Each
+        cell stores the record index of the polygon containing it, or -1 if 
+        it's outside all polygons, when no polygon boundary passes through the
+        cell.  Cells touched by a boundary store -2 and points falling in them
+        need an exact polygon test.
+        
+        A cell's value is found by locating its centre.  Boundaries are traced
+        by sampling each edge at intervals of half a cell and marking the 
+        cell around each sample along with its neighbours, so every cell an 
+        edge passes through is marked even where the edge clips a corner.
+
+        Parameters
+        ----------
+        bounds : tuple of float
+            (min x, min y, max x, max y) extent of the grid.
+        cell_size : float
+            Width and height of each cell, in degrees.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        min_x, min_y, max_x, max_y = bounds
+        num_x = max(int(np.ceil((max_x - min_x) / cell_size)), 1)
+        num_y = max(int(np.ceil((max_y - min_y) / cell_size)), 1)
+        
+        # classify each cell by its centre point
+        centre_x = min_x + (np.arange(num_x) + 0.5) * cell_size
+        centre_y = min_y + (np.arange(num_y) + 0.5) * cell_size
+        grid_x, grid_y = np.meshgrid(centre_x, centre_y)
+        grid = self.__locate_exact_many(grid_x.ravel(), grid_y.ravel())
+        grid = grid.reshape(num_y, num_x).astype('int32')
+        
+        # then mark every cell that a polygon boundary passes through
+        boundary = np.zeros((num_y, num_x), dtype=bool)
+        
+        for geometry in self.geometries:
+            edges = geometry.boundary
+            
+            for line in getattr(edges, 'geoms', [edges]):
+                coords = np.asarray(line.coords)[:, :2]
+                
+                if len(coords) < 2:
+                    continue
+                
+                starts = coords[:-1]
+                deltas = coords[1:] - starts
+                lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+                steps = np.maximum(np.ceil(lengths / (cell_size / 2)).astype('int64'), 1)
+                
+                # evenly spaced samples along each edge, including both ends
+                counts = steps + 1
+                edge = np.repeat(np.arange(len(starts)), counts)
+                first = np.repeat(np.cumsum(counts) - counts, counts)
+                fraction = (np.arange(counts.sum()) - first) / steps[edge]
+                samples = starts[edge] + deltas[edge] * fraction[:, None]
+                
+                cell_x = np.floor((samples[:, 0] - min_x) / cell_size).astype('int64')
+                cell_y = np.floor((samples[:, 1] - min_y) / cell_size).astype('int64')
+                
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        boundary[np.clip(cell_y + dy, 0, num_y - 1), 
+                                 np.clip(cell_x + dx, 0, num_x - 1)] = True
+        
+        grid[boundary] = PolygonIndex.grid_boundary
+        
+        self.set_grid(grid, (min_x, min_y), cell_size)
+    
+    
+    def set_grid(self, grid, origin, cell_size):
+        """
+        Attaches a previously built raster grid to the index.
+
+        Parameters
+        ----------
+        grid : numpy.ndarray of int
+            Cell values indexed by [row (y), column (x)].
+        origin : tuple of float
+            (min x, min y) corner of the grid.
+        cell_size : float
+            Width and height of each cell, in degrees.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.grid = grid
+        self.grid_origin = tuple(origin)
+        self.grid_cell_size = cell_size
+        
+        
+    def grid_lookup(self, x, y):
+        """
+        Looks up the grid cell value for each of a set of points.  Points 
+        outside the grid (or with missing coordinates) are given the boundary
+        value so that they are tested exactly.
+
+        Parameters
+        ----------
+        x : numpy.ndarray of float
+            Point x coordinates (longitude).
+        y : numpy.ndarray of float
+            Point y coordinates (latitude).
+
+        Returns
+        -------
+        values : numpy.ndarray of int
+            Grid cell value for each point.
+
+        """
+        
+        num_y, num_x = self.grid.shape
+        cell_x = np.floor((x - self.grid_origin[0]) / self.grid_cell_size)
+        cell_y = np.floor((y - self.grid_origin[1]) / self.grid_cell_size)
+        
+        inside = (cell_x >= 0) & (cell_x < num_x) & (cell_y >= 0) & (cell_y < num_y)
+        values = np.full(len(x), PolygonIndex.grid_boundary, dtype=self.grid.dtype)
+        values[inside] = self.grid[cell_y[inside].astype('int64'), cell_x[inside].astype('int64')]
+        
+        return values
+    
+    
+##############################################################################
+#                              POINT INDEX CLASS                             #
+##############################################################################
+
+class PointIndex:
+    """
+    Class to bucket a set of points (eg. streetlights) into a regular grid of
+    latitude/longitude cells, so that finding the points within some distance
+    of a query point only needs to examine the surrounding cells rather than
+    every point.
+    
+    The number of surrounding cells searched is worked out from the query 
+    radius so that no point within the radius is ever missed, and candidates
+    are then checked with the exact haversine distance.
+    """
+    
+    # number of query points to process at a time, bounds memory use
+    chunk_size = 10000
+    
+    def __init__(self, lat, long, cell_size):
+        """
+        Builds the grid buckets for a set of points.
+
+        Parameters
+        ----------
+        lat : array-like of float
+            Latitude of each point.
+        long : array-like of float
+            Longitude of each point.
+        cell_size : float
+            Approximate width and height of each grid cell in km, ideally
+            close to the most commonly used query radius.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        lat = np.asarray(lat, dtype='float64')
+        long = np.asarray(long, dtype='float64')
+        
+        # points without a location can never be within range of anything
+        self.positions = np.flatnonzero(np.isfinite(lat) & np.isfinite(long))
+        self.lat = lat[self.positions]
+        self.long = long[self.positions]
+        
+        if len(self.positions):
+            self.origin = (self.lat.min(), self.long.min())
+            self.max_abs_lat = np.abs(self.lat).max()
+        else:
+            self.origin = (0.0, 0.0)
+            self.max_abs_lat = 0.0
+        
+        # cell size in degrees, with longitude cells widened to be roughly 
+        # square on the ground
+        self.lat_cell = np.degrees(cell_size / EARTH_RADIUS)
+        self.long_cell = self.lat_cell / max(np.cos(np.radians(self.max_abs_lat)), 1e-6)
+        
+        # sort the points by cell so each cell is a contiguous block
+        keys = self.__keys(*self.__cells(self.lat, self.long))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        
+        
+    def __len__(self):
+        """
+        Returns the number of indexed points.
+
+        Returns
+        -------
+        int
+            Number of points with a valid location.
+
+        """
+        
+        return len(self.positions)
+    
+    
+    def __cells(self, lat, long):
+        """
+        Returns the grid cell coordinates of each point.  Points without a 
+        location, or far beyond the grid, are clamped to the grid limits.
+
+        Parameters
+        ----------
+        lat : numpy.ndarray of float
+            Latitudes.
+        long : numpy.ndarray of float
+            Longitudes.
+
+        Returns
+        -------
+        cell_x : numpy.ndarray of int
+            Cell column of each point.
+        cell_y : numpy.ndarray of int
+            Cell row of each point.
+
+        """
+        
+        limit = 2**20
+        
+        with np.errstate(invalid='ignore'):
+            cell_x = np.floor((long - self.origin[1]) / self.long_cell)
+            cell_y = np.floor((lat - self.origin[0]) / self.lat_cell)
+        
+        cell_x = np.clip(np.nan_to_num(cell_x, nan=limit), -limit, limit).astype('int64')
+        cell_y = np.clip(np.nan_to_num(cell_y, nan=limit), -limit, limit).astype('int64')
+        
+        return cell_x, cell_y
+    
+    
+    def __keys(self, cell_x, cell_y):
+        """
+        Combines cell coordinates into a single sortable key.
+
+        Parameters
+        ----------
+        cell_x : numpy.ndarray of int
+            Cell columns.
+        cell_y : numpy.ndarray of int
+            Cell rows.
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Cell keys.
+
+        """
+        
+        limit = 2**21
+        
+        return (cell_x + limit) * (2 * limit + 1) + (cell_y + limit)
+    
+    
+    def __reach(self, radius):
+        """
+        Returns how many cells either side of a query point must be searched
+        to be sure of finding every point within a radius.
+        
+        Along a meridian a distance d spans d/R radians of latitude.  For 
+        longitude, the haversine formula gives d >= 2R.asin(c.sin(dlon/2)) 
+        where c is the smallest cosine of latitude involved, so the widest
+        longitude span is 2.asin(sin(d/2R)/c).
+
+        Parameters
+        ----------
+        radius : float
+            Search radius in km.
+
+        Returns
+        -------
+        reach_x : int
+            Number of cells to search either side in longitude.
+        reach_y : int
+            Number of cells to search either side in latitude.
+
+        """
+        
+        lat_span = np.degrees(radius / EARTH_RADIUS)
+        min_cos = np.cos(np.radians(min(self.max_abs_lat + lat_span, 90.0)))
+        ratio = np.sin(radius / (2 * EARTH_RADIUS)) / max(min_cos, 1e-12)
+        long_span = np.degrees(2 * np.arcsin(min(ratio, 1.0)))
+        
+        reach_x = int(np.ceil(long_span / self.long_cell))
+        reach_y = int(np.ceil(lat_span / self.lat_cell))
+        
+        return reach_x, reach_y
+    
+    
+    def pairs_within(self, lat, long, radius):
+        """
+        Finds every pair of query point and indexed point that are less than 
+        a given distance apart.
+
+        Parameters
+        ----------
+        lat : array-like of float
+            Latitude of each query point.
+        long : array-like of float
+            Longitude of each query point.
+        radius : float
+            Search radius in km.
+
+        Returns
+        -------
+        query : numpy.ndarray of int
+            Position of the query point in each pair.
+        point : numpy.ndarray of int
+            Position of the indexed point in each pair, relative to the 
+            points originally given to the index.
+        distance : numpy.ndarray of float
+            Distance in km between the points in each pair.
+
+        """
+        
+        lat = np.asarray(lat, dtype='float64')
+        long = np.asarray(long, dtype='float64')
+        
+        queries, points, distances = [], [], []
+        
+        if len(self):
+            reach_x, reach_y = self.__reach(radius)
+            
+            for start in range(0, len(lat), PointIndex.chunk_size):
+                chunk = slice(start, start + PointIndex.chunk_size)
+                query, point, distance = self.__chunk_pairs(lat[chunk], long[chunk], radius,
+                                                            reach_x, reach_y)
+                queries.append(query + start)
+                points.append(point)
+                distances.append(distance)
+        
+        if not queries:
+            return (np.array([], dtype='int64'), np.array([], dtype='int64'), 
+                    np.array([], dtype='float64'))
+        
+        return np.concatenate(queries), np.concatenate(points), np.concatenate(distances)
+    
+    
+    def __chunk_pairs(self, lat, long, radius, reach_x, reach_y):
+        """
+        Finds the pairs within range for a chunk of query points by gathering
+        every indexed point in the surrounding cells and checking its exact 
+        distance.
+
+        Parameters
+        ----------
+        lat : numpy.ndarray of float
+            Latitude of each query point.
+        long : numpy.ndarray of float
+            Longitude of each query point.
+        radius : float
+            Search radius in km.
+        reach_x : int
+            Number of cells to search either side in longitude.
+        reach_y : int
+            Number of cells to search either side in latitude.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            Query positions, point positions, and distances, as for 
+            pairs_within.
+
+        """
+        
+        cell_x, cell_y = self.__cells(lat, long)
+        queries, members = [], []
+        
+        # keys are ordered by column then row, so the cells in one column
+        # of the search window form a single contiguous block of points
+        for dx in range(-reach_x, reach_x + 1):
+            first = np.searchsorted(self.keys, self.__keys(cell_x + dx, cell_y - reach_y), side='left')
+            last = np.searchsorted(self.keys, self.__keys(cell_x + dx, cell_y + reach_y), side='right')
+            counts = last - first
+            
+            # expand each query's block of sorted points into pairs
+            total = counts.sum()
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            queries.append(np.repeat(np.arange(len(lat)), counts))
+            members.append(np.repeat(first, counts) + offsets)
+        
+        query = np.concatenate(queries)
+        member = self.order[np.concatenate(members)]
+        
+        distance = haversine(lat[query], long[query], self.lat[member], self.long[member])
+        within = distance < radius
+        
+        return query[within], self.positions[member[within]], distance[within]
+    
+    
+    def count_within(self, lat, long, radius):
+        """
+        Counts the indexed points less than a given distance from each query
+        point.
+
+        Parameters
+        ----------
+        lat : array-like of float
+            Latitude of each query point.
+        long : array-like of float
+            Longitude of each query point.
+        radius : float
+            Search radius in km.
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Number of indexed points within range of each query point.
+
+        """
+        
+        query, _, _ = self.pairs_within(lat, long, radius)
+        
+        return np.bincount(query, minlength=len(np.asarray(lat)))
+    
+    
+    def nearest_distance(self, lat, long, max_distance):
+        """
+        Finds the distance from each query point to its nearest indexed point.
+        The search starts at the grid cell size and doubles until every 
+        query point has a neighbour or the maximum distance is reached.
+
+        Parameters
+        ----------
+        lat : array-like of float
+            Latitude of each query point.
+        long : array-like of float
+            Longitude of each query point.
+        max_distance : float
+            Furthest distance in km to search.
+
+        Returns
+        -------
+        nearest : numpy.ndarray of float
+            Distance in km to the nearest indexed point, NaN if there are
+            none within the maximum distance.
+
+        """
+        
+        lat = np.asarray(lat, dtype='float64')
+        long = np.asarray(long, dtype='float64')
+        nearest = np.full(len(lat), np.inf)
+        
+        remaining = np.arange(len(lat))
+        radius = min(np.radians(self.lat_cell) * EARTH_RADIUS, max_distance)
+        
+        while len(remaining):
+            query, _, distance = self.pairs_within(lat[remaining], long[remaining], radius)
+            np.minimum.at(nearest, remaining[query], distance)
+            
+            if radius >= max_distance:
+                break
+            
+            remaining = remaining[~np.isfinite(nearest[remaining])]
+            radius = min(radius * 2, max_distance)
+        
+        nearest[~np.isfinite(nearest)] = np.nan
+        
+        return nearest
+    
+    
 ##############################################################################
 #                                 SUBURB CLASS                               #
 ##############################################################################
@@ -600,14 +1365,37 @@ class Suburb:
     level_map = {'Gazetted Locality': 'suburb',
                  'District': 'district'}
     
-    def __init__(self, data_path):
+    # bump whenever the layout of the cache file changes
+    cache_version = 2
+    
+    def __init__(self, data_path, min_district_overlap=None, cache_file=None,
+                 grid_cell_size=None):
         """
         Takes the path to the '.shp' shapefile and initialises the Suburb object.
+        
+        If a cache file is given, and it was written from the same shapefile
+        with the same settings, the processed geometry, record ranges and 
+        district lookup are reloaded from it instead of being rebuilt.  
+        Otherwise they are built from the shapefile and written to the cache.
+        Any raster lookup grid is stored in the same cache.
 
         Parameters
         ----------
         data_path : str or Path
             Path to the '.shp' shapefile.
+        min_district_overlap : float, optional
+            Fraction of a suburb's area that must overlap a district for the 
+            suburb to count as part of that district when building the 
+            district lookup.  If None any intersection counts, so suburbs that
+            merely touch a neighbouring district's edge are left out of the 
+            lookup. The default is None.
+        cache_file : str or Path, optional
+            Path of the file to cache the processed shapefile data in. The 
+            default is None, no caching.
+        grid_cell_size : float, optional
+            Cell size, in degrees, of a raster lookup grid to build over the
+            suburbs and districts so most points can be located by an array
+            lookup. The default is None, no grid.
 
         Returns
         -------
@@ -615,14 +1403,232 @@ class Suburb:
 
         """
         
-        # read in the shapefile shapes and records
-        sf = shapefile.Reader(data_path)
-        self.shapes = sf.shapes()
-        self.records = sf.records()
+        self.min_district_overlap = min_district_overlap
+        self.grid_cell_size = grid_cell_size
+        self.__data_path = Path(data_path)
+        self.__grids = None
+        
+        cached = cache_file is not None and self.__read_cache(cache_file)
+        
+        if not cached:
+            # read in the shapefile shapes and records
+            sf = shapefile.Reader(data_path)
+            self.shapes = sf.shapes()
+            self.records = sf.records()
+            self.geometries = [shape(s) for s in self.shapes]
+            self.__calculate_record_ranges()
         
         # preprocess data for improved efficiency when interrogated
-        self.__calculate_record_ranges()
-        self.__build_district_lookup()
+        self.__build_spatial_index()
+        
+        if not cached:
+            self.__build_district_lookup()
+            
+        grids_built = self.__build_grids()
+        
+        if cache_file is not None and (not cached or grids_built):
+            self.__write_cache(cache_file)
+
+
+    def __getstate__(self):
+        """
+        Returns the state of the object for pickling (eg. to send it to a
+        worker process).  The spatial indexes hold prepared geometries, which
+        can't be pickled, so they are left out and rebuilt on unpickling.
+
+        Returns
+        -------
+        dict
+            The object attributes, less the spatial indexes.
+
+        """
+
+        state = self.__dict__.copy()
+        del state['suburb_index']
+        del state['district_index']
+
+        return state
+
+
+    def __setstate__(self, state):
+        """
+        Restores the object from its pickled state, rebuilding the spatial
+        indexes and reattaching any raster lookup grids.
+
+        Parameters
+        ----------
+        state : dict
+            The state from __getstate__.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.__dict__.update(state)
+        self.__build_spatial_index()
+        self.__build_grids()
+
+
+    def __shapefile_paths(self):
+        """
+        Returns the paths of the shapefile component files that hold the 
+        shapes and records.
+
+        Returns
+        -------
+        list of Path
+            The existing '.shp', '.shx' and '.dbf' files.
+
+        """
+        
+        paths = [self.__data_path.with_suffix(suffix) for suffix in ['.shp', '.shx', '.dbf']]
+        
+        return [path for path in paths if path.is_file()]
+    
+    
+    def __shapefile_stats(self):
+        """
+        Returns the name, size and modification time of each shapefile 
+        component file, a cheap check for whether the shapefile has changed.
+
+        Returns
+        -------
+        list of tuple
+            (name, size in bytes, modification time in ns) for each file.
+
+        """
+        
+        stats = []
+        
+        for path in self.__shapefile_paths():
+            file_stat = path.stat()
+            stats.append((path.name, file_stat.st_size, file_stat.st_mtime_ns))
+            
+        return stats
+    
+    
+    def __shapefile_hash(self):
+        """
+        Returns a hash of the contents of the shapefile component files, used
+        when the file sizes or modification times don't match the cache.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest.
+
+        """
+        
+        digest = hashlib.sha256()
+        
+        for path in self.__shapefile_paths():
+            with open(path, 'rb') as fin:
+                for block in iter(lambda: fin.read(1 << 20), b''):
+                    digest.update(block)
+                    
+        return digest.hexdigest()
+    
+    
+    def __read_cache(self, cache_file):
+        """
+        Attempts to load the processed shapefile data from a cache file.  The 
+        cache is only used if it matches the current cache version and 
+        district overlap setting, and the shapefile is unchanged: either its 
+        file sizes and modification times match, or its contents hash does.
+
+        Parameters
+        ----------
+        cache_file : str or Path
+            Path to the cache file.
+
+        Returns
+        -------
+        bool
+            True if the cache was valid and loaded, otherwise False.
+
+        """
+        
+        cache_path = Path(cache_file)
+        
+        if not cache_path.is_file():
+            return False
+        
+        try:
+            with open(cache_path, 'rb') as fin:
+                cache = pickle.load(fin)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        
+        if not isinstance(cache, dict) or cache.get('version') != Suburb.cache_version:
+            return False
+        
+        if cache['min_district_overlap'] != self.min_district_overlap:
+            return False
+        
+        stats = self.__shapefile_stats()
+        refresh = False
+        
+        if cache['stats'] != stats:
+            if cache['hash'] != self.__shapefile_hash():
+                return False
+            
+            # contents unchanged (eg. re-extracted), update the stored stats
+            refresh = True
+        
+        self.records = cache['records']
+        self.geometries = [wkb.loads(geometry) for geometry in cache['geometries']]
+        self.shapes = self.geometries
+        self.suburb_range = cache['suburb_range']
+        self.district_range = cache['district_range']
+        self.district_lookup = cache['district_lookup']
+        self.__grids = cache['grids']
+        
+        if refresh:
+            self.__write_cache(cache_file)
+        
+        return True
+    
+    
+    def __write_cache(self, cache_file):
+        """
+        Writes the processed shapefile data to a cache file, keyed by the 
+        shapefile's file sizes, modification times and contents hash.
+
+        Parameters
+        ----------
+        cache_file : str or Path
+            Path to the cache file.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        cache_path = Path(cache_file)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        cache = {'version': Suburb.cache_version,
+                 'stats': self.__shapefile_stats(),
+                 'hash': self.__shapefile_hash(),
+                 'min_district_overlap': self.min_district_overlap,
+                 'records': [list(record) for record in self.records],
+                 'geometries': [geometry.wkb for geometry in self.geometries],
+                 'suburb_range': self.suburb_range,
+                 'district_range': self.district_range,
+                 'district_lookup': self.district_lookup,
+                 'grids': self.__grids}
+        
+        # write to a temporary file first so an interrupted run can't leave
+        # a half written cache behind
+        temp_path = cache_path.with_suffix(cache_path.suffix + '.tmp')
+        
+        with open(temp_path, 'wb') as fout:
+            pickle.dump(cache, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            
+        temp_path.replace(cache_path)
         
         
     def __calculate_record_ranges(self):
@@ -660,12 +1666,72 @@ class Suburb:
         self.district_range = range(first_district, last_district + 1)
         
         
+    def __build_spatial_index(self):
+        """
+        Builds separate spatial indexes over the suburb and district polygons
+        so points can be located without testing every boundary.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.suburb_index = PolygonIndex(self.geometries, self.suburb_range)
+        self.district_index = PolygonIndex(self.geometries, self.district_range)
+        
+        
+    def __build_grids(self):
+        """
+        Attaches raster lookup grids of the requested cell size to the suburb
+        and district indexes, reusing grids loaded from the cache where the
+        cell size matches, otherwise building them over the bounding box of 
+        all the shapefile polygons.
+
+        Returns
+        -------
+        bool
+            True if new grids were built, otherwise False.
+
+        """
+        
+        if self.grid_cell_size is None:
+            return False
+        
+        grids = self.__grids
+        
+        if grids is None or grids['cell_size'] != self.grid_cell_size:
+            all_bounds = np.array([geometry.bounds for geometry in self.geometries])
+            bounds = (all_bounds[:, 0].min(), all_bounds[:, 1].min(),
+                      all_bounds[:, 2].max(), all_bounds[:, 3].max())
+            
+            self.suburb_index.build_grid(bounds, self.grid_cell_size)
+            self.district_index.build_grid(bounds, self.grid_cell_size)
+            
+            self.__grids = {'cell_size': self.grid_cell_size,
+                            'origin': self.suburb_index.grid_origin,
+                            'suburb': self.suburb_index.grid,
+                            'district': self.district_index.grid}
+            return True
+        
+        self.suburb_index.set_grid(grids['suburb'], grids['origin'], grids['cell_size'])
+        self.district_index.set_grid(grids['district'], grids['origin'], grids['cell_size'])
+        
+        return False
+        
+        
     def __build_district_lookup(self):
         """
         Builds an index of each suburb that can be uniquely mapped to a 
         particular district.  This speeds up searching as once a point is located
         in a suburb if the district can be mapped there's no need to additionally
         search the district boundaries to find the correct placement.
+        
+        Only districts whose bounding boxes intersect a suburb are tested, 
+        using the district spatial index.  If a minimum district overlap was
+        given then a district is only counted when it covers at least that
+        fraction of the suburb's area.  Points in any small remainder of the
+        suburb will then be assigned the majority district.
 
         Returns
         -------
@@ -674,17 +1740,25 @@ class Suburb:
         """
         
         lookup = defaultdict(list)
+        districts = self.district_index
         
         for i in self.suburb_range:
             suburb = self.records[i][3]
-            suburb_boundary = shape(self.shapes[i])
+            suburb_boundary = self.geometries[i]
         
-            for j in self.district_range:
-                district = self.records[j][3]
-                district_boundary = shape(self.shapes[j])
-        
-                if suburb_boundary.intersects(district_boundary):
-                    lookup[suburb].append(district)
+            for k in districts.candidates(suburb_boundary):
+                district = self.records[districts.record_indexes[k]][3]
+                
+                if not districts.prepared[k].intersects(suburb_boundary):
+                    continue
+                
+                if self.min_district_overlap is not None and suburb_boundary.area > 0:
+                    overlap = suburb_boundary.intersection(districts.geometries[k]).area
+                    
+                    if overlap / suburb_boundary.area < self.min_district_overlap:
+                        continue
+                
+                lookup[suburb].append(district)
         
         # only include suburbs that map to a single district
         self.district_lookup = {k: v[0] for k, v in lookup.items() if len(v) == 1}
@@ -714,13 +1788,11 @@ class Suburb:
         suburb = ''
         
         # first find suburb
-        for i in self.suburb_range:
-            suburb_boundary = shape(self.shapes[i])
+        i = self.suburb_index.locate(point)
         
-            if point.within(suburb_boundary):
-                suburb = self.records[i][3]
-                location['suburb'] = suburb
-                break
+        if i is not None:
+            suburb = self.records[i][3]
+            location['suburb'] = suburb
            
         # then check if it's in the district lookup
         if suburb in self.district_lookup:
@@ -728,12 +1800,10 @@ class Suburb:
             return location
         
         # otherwise find the district
-        for i in self.district_range:
-            district_boundary = shape(self.shapes[i])
+        i = self.district_index.locate(point)
         
-            if point.within(district_boundary):
-                location['district'] = self.records[i][3]
-                return location
+        if i is not None:
+            location['district'] = self.records[i][3]
                 
         return location
     
@@ -742,7 +1812,8 @@ class Suburb:
         """
         Takes a pandas DataFrame that includes 'lat' and 'long' columns and
         determines the suburb and district for each and returns a copy of
-        the DataFrame with 'suburb' and 'district' columns added.
+        the DataFrame with categorical 'suburb' and 'district' columns added.
+        All points are located together rather than row by row.
 
         Parameters
         ----------
@@ -756,10 +1827,27 @@ class Suburb:
 
         """
         
-        res = [self.__locate(lat, long) for lat, long in zip(df['lat'], df['long'])]  
-        res_df = pd.DataFrame(res)
-        res_df.fillna('', inplace=True)
-        return df.join(res_df, how='left')
+        # record names with a trailing blank, so that a 'not found' index of
+        # -1 maps straight to ''
+        names = np.array([record[3] for record in self.records] + [''], dtype=object)
+        
+        lat = df['lat'].to_numpy(dtype='float64')
+        long = df['long'].to_numpy(dtype='float64')
+        
+        # first find all suburbs
+        suburbs = names[self.suburb_index.locate_many(long, lat)]
+        
+        # then map any suburbs found in the district lookup
+        districts = pd.Series(suburbs, dtype=object).map(self.district_lookup).to_numpy(dtype=object)
+        
+        # otherwise find the district for the remaining points
+        missing = pd.isna(districts)
+        districts[missing] = names[self.district_index.locate_many(long[missing], lat[missing])]
+        
+        res_df = df.copy()
+        res_df['suburb'] = pd.Categorical(suburbs)
+        res_df['district'] = pd.Categorical(districts)
+        return res_df
     
     
     def locate(self, *args):
@@ -881,7 +1969,8 @@ def load_data(data_index_path):
             data_content = read_json_into_df(data_path)
         # if the data source is a Shapefile then load a Suburb object
         elif data_format.lower() == 'shp':
-            data_content = Suburb(data_path)     
+            data_content = Suburb(data_path, cache_file=Path(DATA_FOLDER) / SUBURB_CACHE,
+                                  grid_cell_size=SUBURB_GRID_CELL_SIZE)
         else:
             continue    
          
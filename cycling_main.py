@@ -90,6 +90,7 @@ if __name__ == '__main__':
     from cycling_download_data import *
     from cycling_load_data import *
     from cycling_data_integration import *
+    from cycling_pipeline import *
     from cycling_helper_functions import *
 
     
@@ -116,67 +117,88 @@ if __name__ == '__main__':
     
     processed_data_tables = ['cyclists',
                              'crashes'] 
-    data_paths = {data_table: Path(DATA_FOLDER) / (data_table + '.csv') 
+    data_paths = {data_table: table_path(DATA_FOLDER, data_table, columnar=False) 
                   for data_table in processed_data_tables}
     
-    if all([file_exists(data_paths[table]) for table in data_paths]):
-        ######################################################################
-        #                        LOAD PROCESSED DATA                         #
-        ######################################################################
+    analysed_data_found = all([file_exists(data_paths[table]) for table in data_paths])
+    
+    if analysed_data_found:
         print('All local data sources found')
-        
-        integrated_data = {}
-        
-        for table, path in data_paths.items():
-            integrated_data[table] = read_csv_to_df(path)
     else:
         print('Local data sources ... NOT FOUND')
-        
-        
-        ######################################################################
-        #         CHECK FOR LOCAL RAW DATA OTHERWISE DOWNLOAD DATA           #
-        ######################################################################
-        print_header('Checking Local Raw Data Sources')
-        
-        data_index_path = Path(DATA_FOLDER) / DATA_INDEX
     
-        if not check_local_data(data_index_path):
-            print()
-            print_header('Downloading Raw Data')
-            
-            download_all_data(DATA_SOURCES, DATA_FOLDER, DATA_INDEX)
-        else:
-            print()
-            print('All raw data sources found')
     
-        
-        ######################################################################
-        #                           LOAD RAW DATA                            #
-        ######################################################################
-        print_header('Loading Raw Data')
-        
-        data = load_data(data_index_path)
+    ##########################################################################
+    #            CHECK FOR LOCAL RAW DATA OTHERWISE DOWNLOAD DATA            #
+    ##########################################################################
+    print_header('Checking Local Raw Data Sources')
+    
+    data_index_path = Path(DATA_FOLDER) / DATA_INDEX
+    
+    # the raw data is only downloaded if there's no analysed data, without it
+    # the analysed data on disk can't be checked for changes and is used as is
+    raw_data_found = check_local_data(data_index_path)
+    
+    if raw_data_found:
         print()
-        print('All raw data sources loaded')
-        
-        
-        ######################################################################
-        #                           ANALYSE DATA                             #
-        ######################################################################
-        print_header('Analysing Raw Data')
+        print('All raw data sources found')
+    elif not analysed_data_found:
+        print()
+        print_header('Downloading Raw Data')
         
-        print('This may take a minute, please be patient ... ', end='')
-        integrated_data = integration(data)
-        print('complete')
+        download_all_data(DATA_SOURCES, DATA_FOLDER, DATA_INDEX)
+        raw_data_found = True
+    else:
         print()
+        print('Raw data sources not found, using the analysed data already on disk')
+    
+    
+    ##########################################################################
+    #                              ANALYSE DATA                              #
+    ##########################################################################
+    if raw_data_found:
+        print_header('Analysing Data')
         
-        for table_name, df in integrated_data.items():
-            output_path = Path(DATA_FOLDER) / (table_name + '.csv')
-            print(f'  Writing {table_name} data to disk: {output_path}')
-            write_df_to_csv(df, output_path)
+        # the analysed data on disk is up to date if the output of each of
+        # its stages is cached for the current raw data and settings. the
+        # crashes of incremental runs are kept outside the stage cache, so 
+        # those always run
+        pipeline = integration_pipeline(data_index_path, verbose=False)
+        analysis_current = (analysed_data_found and not INCREMENTAL_INTEGRATION and 
+                            all([pipeline.is_cached(table) for table in processed_data_tables]))
+        
+        if analysis_current:
+            print('Analysed data is up to date')
+        else:
+            # each stage of the analysis is cached, so only stages affected 
+            # by changes to the raw data or settings since the last run are 
+            # recomputed, and the raw data is only loaded if any are. in 
+            # incremental mode only new crashes are analysed
+            print('Running analysis stages, this may take a minute, please be patient:')
+            integrated_data = run_integration(data_index_path, incremental=INCREMENTAL_INTEGRATION)
+            print()
             
-        print()
-        print('All data analysed and written to disk')
+            # tables are written in the columnar format when available, for
+            # the dashboard to load quickly with their types, and always as
+            # CSV too. if the columnar file can't be written it is removed, 
+            # so the dashboard falls back to the CSV rather than an old copy
+            for table_name, df in integrated_data.items():
+                csv_path = table_path(DATA_FOLDER, table_name, columnar=False)
+                columnar_path = table_path(DATA_FOLDER, table_name)
+                
+                print(f'  Writing {table_name} data to disk: {csv_path}')
+                write_df_to_table(df, csv_path)
+                
+                if columnar_path != csv_path:
+                    print(f'  Writing {table_name} data to disk: {columnar_path}')
+                    try:
+                        write_df_to_table(df, columnar_path)
+                    except (ImportError, TypeError, ValueError, OSError) as error:
+                        print(f'  Could not write {columnar_path}, using CSV only: {error}')
+                        Path(columnar_path).unlink(missing_ok=True)
+                
+            print()
+            print('All data analysed and written to disk')
     
     
     ##########################################################################
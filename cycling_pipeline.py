@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module runs the data integration as a pipeline of named stages, caching
+the output of each stage on disk so later runs only recompute the stages
+whose inputs or parameters have changed.
+
+The stages form a graph, each one feeding the stages below it:
+
+    load            : one source per data type in the data index (crash,
+                      cyclist, rainfall, streetlight, suburb)
+    geocode         : suburb and district of each crash
+    solar           : sunrise, sunset and lighting of each crash
+    weather         : closest weather station and rainfall of each crash
+    streetlights    : street light counts and nearest light of each crash
+    crashes         : the integrated crash table, from all of the above
+    cyclists        : the daily rollup of cyclists, rainfall and crashes
+
+Every source and stage has a key, a hash of what determines its output.  A
+source is keyed by the contents of its files, and a stage by its name,
+version, parameters and the keys of its inputs, so a change anywhere only
+changes the keys (and so invalidates the caches) of the stages downstream of
+it.  For example changing only STREETLIGHT_RADII reruns the streetlights and
+crashes stages, but reuses the cached geocode, solar and weather stages.
+
+Raw data is only loaded if a stage actually needs to be recomputed.
+"""
+
+import hashlib
+import json
+import pickle
+import re
+from pathlib import Path
+
+from cycling_globals import *
+from cycling_load_data import *
+from cycling_data_integration import *
+
+
+##############################################################################
+#                               HELPER FUNCTIONS                             #
+##############################################################################
+
+def hash_files(paths):
+    """
+    Returns a hash of the names and contents of a list of files.
+
+    Parameters
+    ----------
+    paths : list of str or Path
+        The files to hash, missing files are skipped.
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest.
+
+    """
+
+    digest = hashlib.sha256()
+
+    for path in paths:
+        path = Path(path)
+
+        if not path.is_file():
+            continue
+
+        digest.update(path.name.encode())
+
+        with open(path, 'rb') as fin:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def source_files(data_source):
+    """
+    Returns the files a data source is read from: the file in the data index
+    plus any files alongside it sharing its name (eg. the '.dbf' and '.shx'
+    parts of a shapefile) and, for rainfall, the data notes.
+
+    Parameters
+    ----------
+    data_source : dict
+        The data source entry in the data index list.
+
+    Returns
+    -------
+    list of Path
+        The source files, sorted by name.
+
+    """
+
+    path = Path(data_source['path'])
+    paths = {path} | set(path.parent.glob(path.stem + '.*'))
+
+    if data_source['type'].lower() == 'rainfall':
+        paths.add(Path(data_source['path'].replace('Data.csv', 'Note.txt')))
+
+    return sorted(paths)
+
+
+##############################################################################
+#                               PIPELINE CLASS                               #
+##############################################################################
+
+class Pipeline:
+    """
+    A graph of named sources and stages, where each stage is a function of
+    the outputs of the sources and stages it takes as inputs.  Stage outputs
+    are cached on disk under the stage key, so any stage whose key hasn't
+    changed since it was last run is read back rather than recomputed.
+    Methods include:
+        add_source - adds data that is loaded rather than computed.
+        add_stage - adds a stage computed from other sources and stages.
+        key - the hash identifying the output of a source or stage.
+        is_cached - whether the output of a stage is in the cache.
+        run - returns the output of a source or stage, running whatever is
+              needed to produce it.
+    """
+
+    cache_version = 1
+
+    def __init__(self, cache_folder=None, verbose=True):
+        """
+        Initialise an empty pipeline.
+
+        Parameters
+        ----------
+        cache_folder : str or Path, optional
+            Folder to cache stage outputs in.  The default is None, which
+            disables caching.
+        verbose : bool, optional
+            Print whether each stage was read from cache or computed.  The
+            default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.cache_folder = None if cache_folder is None else Path(cache_folder)
+        self.verbose = verbose
+        self.__nodes = {}
+        self.__keys = {}
+        self.__outputs = {}
+
+
+    def add_source(self, name, loader, fingerprint):
+        """
+        Adds a source of data to the pipeline.  Sources are never cached, as
+        the loader is expected to read them from disk anyway.
+
+        Parameters
+        ----------
+        name : str
+            Name of the source.
+        loader : callable
+            Function taking no arguments that returns the data.
+        fingerprint : str
+            Hash of whatever determines the data, normally its files.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.__nodes[name] = {'function': loader, 'fingerprint': fingerprint}
+
+
+    def add_stage(self, name, function, inputs, params=None, settings=None, version=1):
+        """
+        Adds a stage to the pipeline.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        function : callable
+            Function called with the outputs of the inputs as positional
+            arguments and the parameters as keyword arguments.
+        inputs : list of str
+            Names of the sources and stages the function takes, in order.
+        params : dict, optional
+            Keyword arguments passed to the function.  The default is None.
+        settings : dict, optional
+            Any other values the output depends on, that the function picks
+            up itself (eg. module constants).  The default is None.
+        version : int, optional
+            Version of the stage, to be increased whenever a change to the
+            code changes its output.  The default is 1.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        for input_name in inputs:
+            if input_name not in self.__nodes:
+                raise KeyError(f'Unknown input to stage {name}: {input_name}')
+
+        self.__nodes[name] = {'function': function,
+                              'inputs': list(inputs),
+                              'params': dict(params or {}),
+                              'settings': dict(settings or {}),
+                              'version': version}
+
+
+    def key(self, name, include_sources=True):
+        """
+        Returns the key of a source or stage, a hash of its name, version,
+        parameters, settings, and the keys of its inputs.
+
+        Parameters
+        ----------
+        name : str
+            Name of the source or stage.
+        include_sources : bool, optional
+            Include the fingerprints of the sources.  The default is True, 
+            False gives a key that only changes with the stage settings and 
+            not the data.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest.
+
+        """
+
+        if (name, include_sources) not in self.__keys:
+            node = self.__nodes[name]
+
+            if 'fingerprint' in node:
+                description = {'source': name,
+                               'fingerprint': node['fingerprint'] if include_sources else None}
+            else:
+                description = {'stage': name,
+                               'cache_version': Pipeline.cache_version,
+                               'version': node['version'],
+                               'params': node['params'],
+                               'settings': node['settings'],
+                               'inputs': [self.key(input_name, include_sources) for input_name in node['inputs']]}
+
+            description = json.dumps(description, sort_keys=True, default=repr)
+            self.__keys[name, include_sources] = hashlib.sha256(description.encode()).hexdigest()
+
+        return self.__keys[name, include_sources]
+
+
+    def is_cached(self, name):
+        """
+        Checks whether a stage's output for its current key is in the cache.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        Returns
+        -------
+        bool
+            True if cached, otherwise False.
+
+        """
+
+        cache_path = self.__cache_path(name)
+
+        return cache_path is not None and cache_path.is_file()
+
+
+    def __cache_path(self, name):
+        """
+        Returns the path of the cache file for a stage's current key.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        Returns
+        -------
+        Path or None
+            The cache file, None if caching is disabled.
+
+        """
+
+        if self.cache_folder is None:
+            return None
+
+        return self.cache_folder / f'{name}_{self.key(name)[:24]}.pickle'
+
+
+    def __read_cache(self, name):
+        """
+        Attempts to read a stage's output from its cache file.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        Returns
+        -------
+        bool, object
+            True and the output if found, otherwise False and None.
+
+        """
+
+        cache_path = self.__cache_path(name)
+
+        if cache_path is None or not cache_path.is_file():
+            return False, None
+
+        try:
+            with open(cache_path, 'rb') as fin:
+                return True, pickle.load(fin)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+
+    def __write_cache(self, name, output):
+        """
+        Writes a stage's output to its cache file, replacing the cached
+        output of any earlier version of the stage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        output : object
+            The output of the stage.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        cache_path = self.__cache_path(name)
+
+        if cache_path is None:
+            return
+
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first so an interrupted run can't leave
+        # a half written cache behind
+        temp_path = cache_path.with_suffix(cache_path.suffix + '.tmp')
+
+        with open(temp_path, 'wb') as fout:
+            pickle.dump(output, fout, protocol=pickle.HIGHEST_PROTOCOL)
+
+        temp_path.replace(cache_path)
+
+        # only files named like a cache file of this stage are removed, not
+        # others that happen to share its prefix (eg. INCREMENTAL_CACHE)
+        cache_file_pattern = re.compile(re.escape(name) + r'_[0-9a-f]{24}\.pickle')
+
+        for old_path in self.cache_folder.glob(f'{name}_*.pickle'):
+            if old_path != cache_path and cache_file_pattern.fullmatch(old_path.name):
+                old_path.unlink()
+
+
+    def run(self, name):
+        """
+        Returns the output of a source or stage, from cache if possible,
+        otherwise by running it (and, as needed, its inputs).
+
+        Parameters
+        ----------
+        name : str
+            Name of the source or stage.
+
+        Returns
+        -------
+        object
+            The output.
+
+        """
+
+        if name in self.__outputs:
+            return self.__outputs[name]
+
+        node = self.__nodes[name]
+
+        if 'fingerprint' in node:
+            output = node['function']()
+        else:
+            found, output = self.__read_cache(name)
+
+            if self.verbose:
+                status = 'cached' if found else 'computing'
+                padding = '.' * (max(len(stage) for stage in self.__nodes) - len(name) + 3)
+                print(f'  {name} {padding} {status}')
+
+            if not found:
+                inputs = [self.run(input_name) for input_name in node['inputs']]
+                output = node['function'](*inputs, **node['params'])
+                self.__write_cache(name, output)
+
+        self.__outputs[name] = output
+
+        return output
+
+
+##############################################################################
+#                         DATA INTEGRATION PIPELINE                          #
+##############################################################################
+
+def add_integration_stages(pipeline):
+    """
+    Adds the data integration stages described at the top of this module to
+    a pipeline that already has a source for each data type.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        The pipeline to add the stages to.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    pipeline.add_stage('geocode', add_class_suburb, ['crash', 'suburb'],
+                       settings={'suburb_cache_version': Suburb.cache_version})
+    pipeline.add_stage('solar', crash_solar, ['crash'],
+                       params={'bucket_size': SOLAR_BUCKET_SIZE, 'time_zone': LOCAL_TIME_ZONE},
+                       settings={'events': SOLAR_EVENTS})
+    pipeline.add_stage('weather', crash_weather, ['crash', 'rainfall'],
+                       params={'neighbours': RAINFALL_IDW_NEIGHBOURS, 'power': RAINFALL_IDW_POWER})
+    pipeline.add_stage('streetlights', crash_streetlights, ['crash', 'streetlight'],
+                       params={'radii': sorted(set(STREETLIGHT_RADII) | {STREETLIGHT_RADIUS}),
+                               'search_limit': STREETLIGHT_SEARCH_LIMIT})
+    pipeline.add_stage('crashes', combine_crash_data, ['crash', 'solar', 'weather', 'geocode', 'streetlights'],
+                       params={'radius': STREETLIGHT_RADIUS})
+    pipeline.add_stage('cyclists', estimated_cyclist_number_daily_rainfall_crash_number,
+                       ['cyclist', 'rainfall', 'crash'])
+
+
+def integration_pipeline(data_index_path, cache_folder=None, verbose=True):
+    """
+    Builds the data integration pipeline for the data sources in a data
+    index, with a source for each data type and the stages described at the
+    top of this module.
+
+    Parameters
+    ----------
+    data_index_path : str or Path
+        Path to the data index CSV file.
+    cache_folder : str or Path, optional
+        Folder to cache stage outputs in.  The default is None, which uses
+        PIPELINE_CACHE in the DATA_FOLDER.
+    verbose : bool, optional
+        Print the progress of the pipeline.  The default is True.
+
+    Returns
+    -------
+    Pipeline
+        The pipeline, where the 'crashes' and 'cyclists' stages give the
+        integrated data.
+
+    """
+
+    if cache_folder is None:
+        cache_folder = Path(DATA_FOLDER) / PIPELINE_CACHE
+
+    pipeline = Pipeline(cache_folder, verbose)
+
+    # the raw data is loaded in one go, the first time any source is needed
+    loaded = {}
+
+    def load_source(data_type):
+        if not loaded:
+            loaded.update(load_data(data_index_path))
+            if verbose:
+                print()
+        return loaded[data_type]
+
+    data_index = read_data_index_csv(data_index_path)
+
+    for data_type in sorted({data_source['type'] for data_source in data_index}):
+        data_sources = [data_source for data_source in data_index if data_source['type'] == data_type]
+        fingerprint = hash_files([path for data_source in data_sources for path in source_files(data_source)])
+        fingerprint += json.dumps(data_sources, sort_keys=True)
+
+        pipeline.add_source(data_type, lambda data_type=data_type: load_source(data_type), fingerprint)
+
+    add_integration_stages(pipeline)
+
+    return pipeline
+
+
+def append_new_crashes(pipeline, previous):
+    """
+    Runs only the crashes whose 'crash_id' isn't in a previously integrated
+    crash table through the crash stages of a pipeline, and appends them to
+    it.  Crashes no longer in the crash data are dropped, the rest are kept as
+    they were.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        The integration pipeline (see integration_pipeline).
+    previous : pandas.DataFrame
+        The integrated crash table from an earlier run of the pipeline.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The integrated crash table for all of the current crash data.
+
+    """
+
+    crash = pipeline.run('crash')
+    new_crashes = crash[~crash['crash_id'].isin(previous['crash_id'])]
+    previous = previous[previous['crash_id'].isin(crash['crash_id'])]
+
+    if pipeline.verbose:
+        print(f'  {len(new_crashes)} new crashes to integrate')
+
+    if new_crashes.empty:
+        return previous.reset_index(drop=True)
+
+    # a pipeline without a cache over just the new crashes, sharing the rest
+    # of the sources
+    new_pipeline = Pipeline(verbose=False)
+    new_pipeline.add_source('crash', lambda: new_crashes, None)
+
+    for data_type in ['cyclist', 'rainfall', 'streetlight', 'suburb']:
+        new_pipeline.add_source(data_type, lambda data_type=data_type: pipeline.run(data_type), None)
+
+    add_integration_stages(new_pipeline)
+
+    crashes = pandas.concat([previous, new_pipeline.run('crashes')], ignore_index=True)
+
+    # categories that only turn up in one part are lost by the concat
+    for column in previous.select_dtypes(include='category').columns:
+        crashes[column] = crashes[column].astype('category')
+
+    return crashes
+
+
+def run_integration(data_index_path, cache_folder=None, verbose=True, incremental=False):
+    """
+    Runs the data integration pipeline (see integration_pipeline), giving the
+    same result as calling 'integration' on the loaded data.
+
+    In incremental mode, if the crash data has changed but none of the stage
+    settings have, only crashes that weren't in the last integrated crash
+    table are run through the crash stages (see append_new_crashes).  The
+    crashes already integrated keep the values they were given at the time,
+    even if the other data sources have since been updated.
+
+    Parameters
+    ----------
+    data_index_path : str or Path
+        Path to the data index CSV file.
+    cache_folder : str or Path, optional
+        Folder to cache stage outputs in.  The default is None, which uses
+        PIPELINE_CACHE in the DATA_FOLDER.
+    verbose : bool, optional
+        Print the progress of the pipeline.  The default is True.
+    incremental : bool, optional
+        Only integrate new crashes.  The default is False.
+
+    Returns
+    -------
+    dict
+        The integrated 'cyclists' and 'crashes' DataFrames.
+
+    """
+
+    pipeline = integration_pipeline(data_index_path, cache_folder, verbose)
+
+    integrated_data = {'cyclists': pipeline.run('cyclists')}
+
+    if not incremental:
+        integrated_data['crashes'] = pipeline.run('crashes')
+        return integrated_data
+
+    # the last integrated crash table is kept along with the key of the stage
+    # settings it was integrated with
+    increment_path = pipeline.cache_folder / INCREMENTAL_CACHE
+    settings_key = pipeline.key('crashes', include_sources=False)
+    previous = None
+
+    if not pipeline.is_cached('crashes') and increment_path.is_file():
+        try:
+            with open(increment_path, 'rb') as fin:
+                increment = pickle.load(fin)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            increment = None
+
+        if isinstance(increment, dict) and increment.get('settings_key') == settings_key:
+            previous = increment['crashes']
+
+    if previous is None:
+        integrated_data['crashes'] = pipeline.run('crashes')
+    else:
+        integrated_data['crashes'] = append_new_crashes(pipeline, previous)
+
+    pipeline.cache_folder.mkdir(parents=True, exist_ok=True)
+    temp_path = increment_path.with_suffix(increment_path.suffix + '.tmp')
+
+    with open(temp_path, 'wb') as fout:
+        pickle.dump({'settings_key': settings_key, 'crashes': integrated_data['crashes']}, fout,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+    temp_path.replace(increment_path)
+
+    return integrated_data
+
+
+##############################################################################
+#                                    MAIN                                    #
+##############################################################################
+
+if __name__ == '__main__':
+
+    from datetime import datetime
+
+    start_time = datetime.now()
+    integrated_data = run_integration(Path(DATA_FOLDER) / DATA_INDEX)
+    duration = datetime.now() - start_time
+
+    print()
+    for table, df in integrated_data.items():
+        print(f'{table}: {len(df)} rows')
+    print(f'running time: {duration}')